@@ -0,0 +1,58 @@
+'''
+Guards the headless import path of swell
+
+Imports swell and the simulation modules in a fresh interpreter, then
+fails if any rendering dependency got loaded or the import took longer
+than the budget.
+
+    python benchmarks/import_time.py [--budget SECONDS]
+'''
+import argparse
+import json
+import subprocess
+import sys
+
+SIM_MODULES = ['swell', 'swell.envs.surf', 'swell.envs.surfer',
+               'swell.envs.custom_env']
+RENDER_MODULES = ['pygame', 'seaborn', 'matplotlib', 'pandas',
+                  'swell.envs.viz']
+
+PROBE = '''
+import json, sys, time
+start = time.perf_counter()
+for name in {modules!r}:
+    __import__(name)
+seconds = time.perf_counter() - start
+print(json.dumps({{'seconds': seconds,
+                  'loaded': [m for m in {render!r} if m in sys.modules]}}))
+'''
+
+
+def measure():
+    probe = PROBE.format(modules=SIM_MODULES, render=RENDER_MODULES)
+    output = subprocess.run([sys.executable, '-c', probe], check=True,
+                            capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--budget', type=float, default=2.0,
+                        help='maximum import time in seconds')
+    args = parser.parse_args()
+
+    result = measure()
+    print('import time: {:.3f}s'.format(result['seconds']))
+    failed = False
+    if result['loaded']:
+        print('rendering modules loaded at import: {}'.format(
+            ', '.join(result['loaded'])))
+        failed = True
+    if result['seconds'] > args.budget:
+        print('import took longer than the {:.3f}s budget'.format(args.budget))
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,310 @@
+'''
+Throughput benchmarks for the simulation, the environments and rendering
+
+Runs every case over a matrix of settings and reports steps/sec, per-step
+latency percentiles and the peak resident memory of the run. Each case runs
+in a fresh interpreter so the memory high-water marks do not leak into each
+other. Results can be written as JSON and compared against an earlier run,
+exiting with status 1 when a case got slower than the threshold allows.
+
+    python benchmarks/suite.py [--cases surfbreak,surfsesh] [--sizes 100,200]
+        [--steps N] [--output results.json] [--compare baseline.json]
+
+Cases and the settings they vary over:
+- surfbreak: SurfBreak.step, over sizes and periods
+- surfer: Surfer.step on a stepping break, over sizes and periods
+- surfsesh: SurfSesh.step, over sizes, periods, obs-modes and render
+- viz: SurfBreakViz.step, over sizes and periods (needs pygame)
+- vec: VectorSurfSesh.step, over sizes, periods and n-envs (needs
+  stable-baselines3)
+'''
+import argparse
+import itertools
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+import numpy as np
+
+# Rendering benchmarks never need a display
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+CASE_PARAMS = {
+    'surfbreak': ('size', 'period'),
+    'surfer': ('size', 'period'),
+    'surfsesh': ('size', 'period', 'obs_mode', 'render'),
+    'viz': ('size', 'period'),
+    'vec': ('size', 'period', 'n_envs'),
+}
+PERCENTILES = (50, 90, 99)
+
+
+def make_surfbreak(size, period):
+    from swell.envs.surf import SurfBreak, Swell
+
+    return SurfBreak(height=size, width=size, swell=Swell(period=period))
+
+
+def setup_surfbreak(size, period):
+    return make_surfbreak(size, period).step
+
+
+def setup_surfer(size, period):
+    from swell.envs.surfer import Surfer
+
+    surfbreak = make_surfbreak(size, period)
+    surfer = Surfer(surfbreak=surfbreak, init_x=size // 2, init_y=size // 2)
+    actions = dict.fromkeys(surfer.action_space, 0)
+
+    def step():
+        surfbreak.step()
+        surfer.step(actions)
+    return step
+
+
+def setup_surfsesh(size, period, obs_mode, render):
+    from swell.envs.custom_env import SurfSesh
+    from swell.envs.observation import SurfObservation
+    from swell.envs.surfer import Surfer
+
+    surfer = Surfer(surfbreak=make_surfbreak(size, period))
+    env = SurfSesh(surfer=surfer, observation=SurfObservation(mode=obs_mode))
+    env.reset()
+    action = np.zeros(len(surfer.action_space), dtype=int)
+
+    def step():
+        env.step(action)
+        if render == 'on':
+            env.render(mode='rgb_array')
+    return step
+
+
+def setup_viz(size, period):
+    from swell.envs.viz import SurfBreakViz
+
+    return SurfBreakViz(make_surfbreak(size, period)).step
+
+
+def setup_vec(size, period, n_envs):
+    from swell.envs.batched import BatchedSurfBreak
+    from swell.envs.surf import Swell
+    from swell.envs.surfer import SurferBatch
+    from swell.envs.vec_env import VectorSurfSesh
+
+    surfbreak = BatchedSurfBreak(n_envs=n_envs, height=size, width=size,
+                                 swells=[Swell(period=period)
+                                         for _ in range(n_envs)])
+    env = VectorSurfSesh(surfers=SurferBatch(surfbreak))
+    env.reset()
+    actions = np.zeros((n_envs, len(env.surfers.action_space)), dtype=int)
+
+    def step():
+        env.step(actions)
+    return step
+
+
+SETUPS = {
+    'surfbreak': setup_surfbreak,
+    'surfer': setup_surfer,
+    'surfsesh': setup_surfsesh,
+    'viz': setup_viz,
+    'vec': setup_vec,
+}
+
+
+def max_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        rss /= 1024
+    return rss / 1024
+
+
+def run_case(case, params, n_steps, n_warmup):
+    """
+    Times n_steps steps of one case after n_warmup untimed ones
+    :return: dict of results
+    """
+    step = SETUPS[case](**params)
+    for _ in range(n_warmup):
+        step()
+
+    latencies = np.empty(n_steps)
+    clock = time.perf_counter
+    for i in range(n_steps):
+        start = clock()
+        step()
+        latencies[i] = clock() - start
+
+    result = {
+        'steps_per_sec': n_steps / latencies.sum(),
+        'max_rss_mb': max_rss_mb(),
+    }
+    for percentile, value in zip(PERCENTILES,
+                                 np.percentile(latencies, PERCENTILES)):
+        result['p{}_ms'.format(percentile)] = value * 1e3
+    result['max_ms'] = latencies.max() * 1e3
+    if case == 'vec':
+        result['env_steps_per_sec'] = result['steps_per_sec'] * \
+            params['n_envs']
+    return result
+
+
+def run_isolated(case, params, n_steps, n_warmup):
+    """
+    Runs one case in a fresh interpreter
+    :return: dict of results, with an 'error' key if the case failed
+    """
+    command = [sys.executable, os.path.abspath(__file__), '--run-case',
+               json.dumps({'case': case, 'params': params,
+                           'steps': n_steps, 'warmup': n_warmup})]
+    process = subprocess.run(command, capture_output=True, text=True)
+    if process.returncode:
+        lines = process.stderr.strip().splitlines()
+        return {'error': lines[-1] if lines else 'exit code {}'.format(
+            process.returncode)}
+    return json.loads(process.stdout.strip().splitlines()[-1])
+
+
+def case_matrix(args):
+    values = {
+        'size': args.sizes,
+        'period': args.periods,
+        'obs_mode': args.obs_modes,
+        'render': args.render,
+        'n_envs': args.n_envs,
+    }
+    for case in args.cases:
+        names = CASE_PARAMS[case]
+        for combination in itertools.product(*(values[name]
+                                               for name in names)):
+            yield case, dict(zip(names, combination))
+
+
+def case_key(result):
+    return result['case'], json.dumps(result['params'], sort_keys=True)
+
+
+def case_label(result):
+    return '{} {}'.format(result['case'], ' '.join(
+        '{}={}'.format(name, value)
+        for name, value in result['params'].items()))
+
+
+def compare(results, baseline, threshold):
+    """
+    Prints the change in steps/sec for every case that is in both runs
+    :return: labels of the cases that got slower by more than threshold
+    """
+    baseline = {case_key(result): result for result in baseline['results']
+                if 'steps_per_sec' in result}
+    regressions = []
+    for result in results:
+        before = baseline.get(case_key(result))
+        if before is None or 'steps_per_sec' not in result:
+            continue
+        change = result['steps_per_sec'] / before['steps_per_sec'] - 1
+        flag = ''
+        if change < -threshold:
+            flag = '  REGRESSION'
+            regressions.append(case_label(result))
+        print('{:<60} {:>12,.1f} -> {:>12,.1f} steps/sec {:+7.1%}{}'.format(
+            case_label(result), before['steps_per_sec'],
+            result['steps_per_sec'], change, flag))
+    return regressions
+
+
+def parse_list(cast):
+    def parse(value):
+        return [cast(item) for item in value.split(',') if item]
+    return parse
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--cases', type=parse_list(str),
+                        default=list(CASE_PARAMS),
+                        help='comma separated cases to run')
+    parser.add_argument('--sizes', type=parse_list(int), default=[100, 200],
+                        help='grid heights and widths')
+    parser.add_argument('--periods', type=parse_list(int), default=[25, 100],
+                        help='swell periods, shorter periods mean more waves')
+    parser.add_argument('--obs-modes', type=parse_list(str),
+                        default=['full', 'window'],
+                        help='SurfObservation modes for surfsesh')
+    parser.add_argument('--render', type=parse_list(str),
+                        default=['off', 'on'],
+                        help="'off' and/or 'on' for surfsesh")
+    parser.add_argument('--n-envs', type=parse_list(int), default=[1, 16],
+                        help='number of environments for vec')
+    parser.add_argument('--steps', type=int, default=500,
+                        help='timed steps per case')
+    parser.add_argument('--warmup', type=int, default=150,
+                        help='untimed steps before timing, enough for the '
+                             'first waves to reach the beach')
+    parser.add_argument('--output', help='write the results as JSON here')
+    parser.add_argument('--compare',
+                        help='JSON results of an earlier run to compare to')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='relative drop in steps/sec that counts as a '
+                             'regression')
+    parser.add_argument('--run-case', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_case:
+        spec = json.loads(args.run_case)
+        print(json.dumps(run_case(spec['case'], spec['params'],
+                                  spec['steps'], spec['warmup'])))
+        return
+
+    unknown = set(args.cases) - set(CASE_PARAMS)
+    if unknown:
+        parser.error('unknown cases: {}'.format(', '.join(sorted(unknown))))
+
+    results = []
+    for case, params in case_matrix(args):
+        result = {'case': case, 'params': params}
+        result.update(run_isolated(case, params, args.steps, args.warmup))
+        results.append(result)
+        if 'error' in result:
+            print('{:<60} skipped: {}'.format(case_label(result),
+                                              result['error']))
+        else:
+            print('{:<60} {:>12,.1f} steps/sec  p50 {:.3f} ms  '
+                  'p99 {:.3f} ms  rss {:.0f} MB'.format(
+                      case_label(result), result['steps_per_sec'],
+                      result['p50_ms'], result['p99_ms'],
+                      result['max_rss_mb']))
+
+    report = {
+        'meta': {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'steps': args.steps,
+            'warmup': args.warmup,
+        },
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print()
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print('\n{} case(s) regressed by more than {:.0%}'.format(
+                len(regressions), args.threshold))
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
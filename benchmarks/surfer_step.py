@@ -0,0 +1,40 @@
+'''
+Micro-benchmark of Surfer.step
+
+Steps one surfer through a warmed-up break that is held still, so only the
+surfer kinematics are timed.
+
+    python benchmarks/surfer_step.py [--steps N]
+'''
+import argparse
+import time
+import numpy as np
+from swell.envs.surf import SurfBreak
+from swell.envs.surfer import Surfer
+
+
+def measure(n_steps, seed=0):
+    surfbreak = SurfBreak(height=250, width=200, water_friction_coef=0.85)
+    for _ in range(150):
+        surfbreak.step()
+    surfer = Surfer(surfbreak=surfbreak, init_x=100, init_y=125)
+
+    rng = np.random.RandomState(seed)
+    presses = rng.rand(n_steps, len(surfer.action_space)) < 0.2
+    actions = [dict(zip(surfer.action_space, row.tolist())) for row in presses]
+
+    start = time.perf_counter()
+    for step_actions in actions:
+        surfer.step(step_actions)
+    return n_steps / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--steps', type=int, default=100000)
+    args = parser.parse_args()
+    print('Surfer.step: {:,.0f} steps/sec'.format(measure(args.steps)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+'''
+Compares the vectorized environment implementations on SurfSesh
+
+Steps n_envs SurfSesh environments with random actions through
+DummyVecEnv, SubprocVecEnv, SharedMemoryVecEnv and ThreadVecEnv and reports
+environment steps/sec for each.
+
+    python benchmarks/vec_envs.py [--n-envs 8] [--size 200] [--steps N]
+'''
+import argparse
+import time
+from functools import partial
+import numpy as np
+from stable_baselines3.common.vec_env import DummyVecEnv, SubprocVecEnv
+from swell.envs.custom_env import SurfSesh
+from swell.envs.shm_vec_env import SharedMemoryVecEnv
+from swell.envs.surf import SurfBreak
+from swell.envs.surfer import Surfer
+from swell.envs.thread_vec_env import ThreadVecEnv
+
+VEC_ENVS = {
+    'dummy': DummyVecEnv,
+    'subproc': SubprocVecEnv,
+    'shm': SharedMemoryVecEnv,
+    'thread': ThreadVecEnv,
+}
+
+
+def make_env(size):
+    return SurfSesh(Surfer(SurfBreak(height=size, width=size)))
+
+
+def measure(vec_env_class, n_envs, size, n_steps, n_warmup, seed=0):
+    env = vec_env_class([partial(make_env, size) for _ in range(n_envs)])
+    try:
+        rng = np.random.RandomState(seed)
+        actions = (rng.rand(n_warmup + n_steps, n_envs,
+                            env.action_space.n) < 0.2).astype(int)
+        env.reset()
+        for step_actions in actions[:n_warmup]:
+            env.step(step_actions)
+        start = time.perf_counter()
+        for step_actions in actions[n_warmup:]:
+            env.step(step_actions)
+        return n_steps * n_envs / (time.perf_counter() - start)
+    finally:
+        env.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--n-envs', type=int, default=8)
+    parser.add_argument('--size', type=int, default=200,
+                        help='grid height and width')
+    parser.add_argument('--steps', type=int, default=300)
+    parser.add_argument('--warmup', type=int, default=150)
+    parser.add_argument('--vec-envs', default=','.join(VEC_ENVS),
+                        help='comma separated implementations to compare')
+    args = parser.parse_args()
+
+    for name in args.vec_envs.split(','):
+        steps_per_sec = measure(VEC_ENVS[name], args.n_envs, args.size,
+                                args.steps, args.warmup)
+        print('{:<8} {:>10,.0f} env steps/sec'.format(name, steps_per_sec))
+
+
+if __name__ == '__main__':
+    main()
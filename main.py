@@ -1,9 +1,21 @@
 '''
 This file allows you to run swell and play the game using the keyboard
+
+The simulation runs at a fixed number of ticks per simulated second,
+independent of how fast frames can be drawn. Every frame runs the ticks
+that came due since the last one and draws the last of them; the ticks in
+between are not rasterized (see SurfBreak.step with defer). Frames are
+drawn at most render_fps times per second, and when drawing falls behind,
+frames are dropped rather than slowing the simulation down.
+
+Keys: arrows to paddle, space to change mode, + and - to speed the
+simulation up or slow it down, escape to quit.
 '''
+import argparse
+import time
 from functools import partial
 import pygame
-from pygame.locals import K_ESCAPE
+from pygame.locals import K_ESCAPE, K_EQUALS, K_KP_PLUS, K_MINUS, K_KP_MINUS
 
 from swell.envs.surf import Swell, SurfBreak, angled_sea_floor
 from swell.envs.surfer import Surfer
@@ -11,46 +23,135 @@ from swell.envs.viz import SurfBreakViz, SurferViz
 from swell.envs.player import KeyboardPlayer
 
 
-def run_game(viz, player, fps=100):
+class RateMeter:
+    def __init__(self, window=1.0):
+        """
+        Counts events and reports their rate over the last window seconds
+        """
+        self.window = window
+        self.count = 0
+        self.start = time.perf_counter()
+        self.rate = 0.0
+
+    def add(self, n=1):
+        self.count += n
+        now = time.perf_counter()
+        if now - self.start >= self.window:
+            self.rate = self.count / (now - self.start)
+            self.count = 0
+            self.start = now
+
+
+def draw_overlay(screen, font, lines):
+    for i, line in enumerate(lines):
+        text = font.render(line, 1, (0, 0, 0))
+        screen.blit(text, (5, 5 + i * font.get_linesize()))
+
+
+def run_game(viz, player, sim_hz=10, render_fps=30, speed=1.0,
+             max_lag=0.25, overlay=True):
+    """
+    Runs the simulation at sim_hz ticks per simulated second and draws it
+    at up to render_fps frames per second
+
+    :param speed: simulated seconds per real second, e.g. 4 to watch a
+        trained agent at four times real time
+    :param max_lag: seconds of real time the simulation may fall behind
+        before it gives up catching up, so a slow machine runs the
+        simulation slower instead of stalling
+    :param overlay: show the stoke, sim ticks/sec, render FPS and the
+        number of dropped frames
+    """
     # Pygame implementation
     successes, failures = pygame.init()
     screen = pygame.display.set_mode((viz.surfbreak.width,
                                       viz.surfbreak.height))
-    clock = pygame.time.Clock()
-    pygame.time.set_timer(STEPALL, fps)
-
     my_font = pygame.font.SysFont("monospace", 16)
-    score_text = my_font.render("Stoke: " + str(player.surfer_viz.surfer.total_stoke),
-                                1, (0, 0, 0))
-    screen.blit(score_text, (5, 5))
+    surfbreak = viz.surfbreak
+    surfer_viz = player.surfer_viz
+
+    tick_dt = 1.0 / sim_hz
+    frame_dt = 1.0 / render_fps
+    tick_meter = RateMeter()
+    frame_meter = RateMeter()
+    dropped_frames = 0
+    lag = 0.0
+    last = next_frame = time.perf_counter()
 
     running = True
     while running:
-        clock.tick(fps)
         # Did the user click the window close button?
-        pressed_keys = pygame.key.get_pressed()
         for event in pygame.event.get():
-            if event.type == pygame.QUIT or pressed_keys[K_ESCAPE]:
+            if event.type == pygame.QUIT:
                 running = False
-            if event.type == STEPALL:
+            elif event.type == pygame.KEYDOWN:
+                if event.key == K_ESCAPE:
+                    running = False
+                elif event.key in (K_EQUALS, K_KP_PLUS):
+                    speed *= 2
+                elif event.key in (K_MINUS, K_KP_MINUS):
+                    speed /= 2
+        pressed_keys = pygame.key.get_pressed()
+
+        now = time.perf_counter()
+        lag = min(lag + (now - last) * speed, max_lag * speed)
+        last = now
+        n_ticks = int(lag / tick_dt)
+        lag -= n_ticks * tick_dt
+
+        for tick in range(n_ticks):
+            # Only the tick that is drawn needs its grids rasterized
+            if tick == n_ticks - 1:
                 viz.step()
-                player.step(pressed_keys)
-                screen.blit(viz.surface, (0, 0))
-                screen.blit(player.surfer_viz.surface,
-                            ((player.surfer_viz.surfer.x - player.surfer_viz.sprite_width / 2),
-                             (player.surfer_viz.surfer.y - player.surfer_viz.sprite_height / 2)))
-                score_text = my_font.render("Stoke: " + str(player.surfer_viz.surfer.total_stoke),
-                                            1, (0, 0, 0))
-                screen.blit(score_text, (5, 5))
-                pygame.display.flip()
+            else:
+                surfbreak.step(defer=True)
+            player.step(pressed_keys)
+        tick_meter.add(n_ticks)
+
+        screen.blit(viz.surface, (0, 0))
+        screen.blit(surfer_viz.surface,
+                    ((surfer_viz.surfer.x - surfer_viz.sprite_width / 2),
+                     (surfer_viz.surfer.y - surfer_viz.sprite_height / 2)))
+        lines = ["Stoke: " + str(surfer_viz.surfer.total_stoke)]
+        if overlay:
+            lines += [
+                "Sim: {:.0f} ticks/s (x{:g})".format(tick_meter.rate, speed),
+                "Render: {:.0f} fps".format(frame_meter.rate),
+                "Dropped: {}".format(dropped_frames),
+            ]
+        draw_overlay(screen, my_font, lines)
+        pygame.display.flip()
+        frame_meter.add()
+
+        # Frames whose time passed while this one was drawn are dropped,
+        # their ticks run with the next frame
+        next_frame += frame_dt
+        now = time.perf_counter()
+        if now > next_frame:
+            missed = int((now - next_frame) / frame_dt) + 1
+            dropped_frames += missed
+            next_frame += missed * frame_dt
+        time.sleep(max(next_frame - now, 0))
 
     pygame.quit()
 
 
-STEPALL = pygame.USEREVENT + 1
-FPS = 100
+# The old event timer fired every FPS=100 milliseconds, keep that pace
+SIM_HZ = 10
+RENDER_FPS = 30
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Play swell')
+    parser.add_argument('--sim-hz', type=float, default=SIM_HZ,
+                        help='simulation ticks per simulated second')
+    parser.add_argument('--render-fps', type=float, default=RENDER_FPS,
+                        help='maximum frames drawn per second')
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help='simulated seconds per real second')
+    parser.add_argument('--no-overlay', action='store_true',
+                        help='hide the performance overlay')
+    args = parser.parse_args()
+
     # Generate Break and Swell
     floor = partial(angled_sea_floor,
                     parallel_coef=0.03,
@@ -73,4 +174,6 @@ if __name__ == '__main__':
     surfer_viz = SurferViz(surfer=surfer)
     player1 = KeyboardPlayer(surfer_viz=surfer_viz)
 
-    run_game(sb_viz, player1, fps=FPS)
+    run_game(sb_viz, player1, sim_hz=args.sim_hz,
+             render_fps=args.render_fps, speed=args.speed,
+             overlay=not args.no_overlay)
@@ -3,7 +3,6 @@ from setuptools import setup
 setup(name='swell',
       version='0.0.1',
       install_requires=['gym',
-                        'seaborn==0.11.1',
                         'pygame==2.0.1',
                         'numpy==1.20.3',
                         'stable-baselines3']
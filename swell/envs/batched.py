@@ -0,0 +1,287 @@
+import numpy as np
+from swell.envs.sea_floor import angled_sea_floor, cached_sea_floor
+from swell.envs.surf import Swell, rasterize_bands
+
+
+class BatchedSurfBreak:
+    def __init__(self, n_envs=1,
+                 height=200,
+                 width=200,
+                 sea_floor_func=angled_sea_floor,
+                 tide_init=1,
+                 swells=None,
+                 water_friction_coef=1,
+                 max_waves=None,
+                 dtype=np.float64,
+                 cache_sea_floor=True):
+        """
+        Steps n_envs independent surf breaks of the same shape together
+
+        Every grid has a leading env axis, e.g. crashing is
+        (n_envs, height, width), and wave state lives in (n_envs, max_waves)
+        slot arrays, so one call to step advances all breaks with a single
+        set of array operations. Each break keeps its own swell parameters
+        (from swells, a list of Swell objects), tide and sea floor, and
+        batch[i] gives a view with the attributes of a single SurfBreak.
+
+        sea_floor_func, tide_init and water_friction_coef can either be a
+        single value shared by all breaks or a sequence with one per break.
+        max_waves is the initial number of wave slots per break; it grows
+        when a break runs out. The grids are preallocated arrays of dtype
+        that are refilled in place every step.
+
+        Floors are cached and shared as in SurfBreak; with cache_sea_floor
+        False every break calls its generator for a floor of its own, so a
+        random generator gives each break a different floor.
+        """
+        self.n_envs = n_envs
+        self.height = height
+        self.width = width
+
+        # Floors come from the shared cache. A single floor is broadcast
+        # over the env axis rather than copied.
+        if callable(sea_floor_func) and cache_sea_floor:
+            floor = cached_sea_floor(sea_floor_func, height, width)
+            self.sea_floor = np.broadcast_to(floor, (n_envs, height, width))
+        else:
+            if callable(sea_floor_func):
+                sea_floor_func = [sea_floor_func] * n_envs
+            self.sea_floor = np.stack([
+                cached_sea_floor(func, height, width, cache=cache_sea_floor)
+                for func in sea_floor_func
+            ])
+        self.base_water_level = self._per_env(tide_init)
+        self.water_friction_coef = self._per_env(water_friction_coef)
+        if np.any(self.water_friction_coef > 1) or \
+                np.any(self.water_friction_coef < 0):
+            raise ValueError('water_friction_coef should be between 0 and 1.')
+
+        self.active_water_level = np.empty((n_envs, height, width),
+                                           dtype=dtype)
+        self.active_water_level[...] = self.base_water_level[:, None, None]
+        self.crashing = np.zeros((n_envs, height, width), dtype=dtype)
+
+        if swells is None:
+            swells = [Swell() for _ in range(n_envs)]
+        if len(swells) != n_envs:
+            raise ValueError('Expected one swell per break.')
+        self.swell_period = np.array([swell.period for swell in swells])
+        self.swell_height = self._per_env([swell.height for swell in swells])
+        self.swell_width = np.array([swell.width for swell in swells])
+        self.swell_angle = self._per_env([swell.angle for swell in swells])
+        self.swell_speed = self._per_env([swell.speed for swell in swells])
+        self.swell_counter = np.array([swell.counter for swell in swells])
+        self.initial_swell_counter = self.swell_counter.copy()
+
+        if max_waves is None:
+            max_waves = self.estimate_max_waves()
+        shape = (n_envs, max_waves)
+        self.wave_height = np.zeros(shape)
+        self.wave_width = np.ones(shape, dtype=np.intp)
+        self.wave_angle = np.zeros(shape)
+        self.wave_speed = np.zeros(shape)
+        self.wave_counter = np.zeros(shape, dtype=np.intp)
+        self.wave_active = np.zeros(shape, dtype=bool)
+        # Whether each wave left wet cells on its current and previous step,
+        # the array counterpart of Wave.band and last_band
+        self.wave_wet = np.zeros(shape, dtype=bool)
+        self.wave_last_wet = np.zeros(shape, dtype=bool)
+        self.n_retired = np.zeros(n_envs, dtype=np.intp)
+        # Always rasterized, see SurfBreak(lazy=True)
+        self.lazy = False
+
+        self.counter = np.zeros(n_envs, dtype=np.intp)
+
+    def _per_env(self, value):
+        values = np.zeros(self.n_envs) + value
+        if values.shape != (self.n_envs,):
+            raise ValueError('Expected a scalar or one value per break.')
+        return values
+
+    def __len__(self):
+        return self.n_envs
+
+    def __getitem__(self, env_ix):
+        return SurfBreakView(self, env_ix)
+
+    @property
+    def max_waves(self):
+        return self.wave_active.shape[1]
+
+    @property
+    def n_live(self):
+        return self.wave_active.sum(axis=1)
+
+    def estimate_max_waves(self):
+        """
+        Number of wave slots needed for every swell to reach steady state
+        :return: int
+        """
+        path = self.height + np.abs(self.swell_angle) * (self.width - 1) + \
+               self.swell_width
+        travel = self.swell_period * np.maximum(np.abs(self.swell_speed), 1e-9)
+        return int(np.minimum(np.ceil(path / travel), path).max()) + 2
+
+    def step(self):
+        """
+        Moves all breaks one time step forward
+        :return: None
+        """
+        self.rasterize_waves()
+        self.retire_waves()
+        self.wave_counter += self.wave_active
+        self.generate_waves(self.swell_counter % self.swell_period == 0)
+        self.swell_counter += 1
+        self.counter += 1
+
+    def rasterize_waves(self):
+        """
+        Writes the waves of every break onto the batched grids
+        :return: None
+        """
+        self.active_water_level[...] = self.base_water_level[:, None, None]
+        self.crashing.fill(0)
+        self.wave_last_wet = self.wave_wet
+        self.wave_wet = np.zeros_like(self.wave_active)
+
+        # rasterize_bands expects waves oldest first. Wave counters are
+        # ages, so sort on them, push empty slots to the back and drop the
+        # slots no break is using.
+        order = np.argsort(np.where(self.wave_active, -self.wave_counter, 1),
+                           axis=1, kind='stable')
+        order = order[:, :max(self.n_live.max(), 1)]
+
+        def take(values):
+            return np.take_along_axis(values, order, axis=1)
+
+        env_ix, wave_ix, _, _ = rasterize_bands(
+            self.active_water_level, self.crashing, self.sea_floor,
+            self.base_water_level,
+            take(self.wave_height), take(self.wave_width),
+            take(self.wave_angle), take(self.wave_speed),
+            take(self.wave_counter), take(self.wave_active)
+        )
+        self.wave_wet[env_ix, order[env_ix, wave_ix]] = True
+
+    def reset_envs(self, env_ix):
+        """
+        Puts the breaks in env_ix back in the state they were created in:
+        still water, no waves and the initial swell phase
+        :return: None
+        """
+        self.active_water_level[env_ix] = \
+            self.base_water_level[env_ix, None, None]
+        self.crashing[env_ix] = 0
+        self.swell_counter[env_ix] = self.initial_swell_counter[env_ix]
+        self.wave_active[env_ix] = False
+        self.wave_wet[env_ix] = False
+        self.wave_last_wet[env_ix] = False
+        self.n_retired[env_ix] = 0
+        self.counter[env_ix] = 0
+
+    def has_left(self):
+        """
+        Vectorized Wave.has_left for every wave slot
+        :return: bool array of shape (n_envs, max_waves)
+        """
+        shift = self.wave_counter * self.wave_speed
+        first = (-shift).astype(np.intp)
+        last = (self.wave_angle * (self.width - 1) - shift).astype(np.intp)
+        above = (np.maximum(first, last) + self.wave_width <= 0) & \
+                (self.wave_speed >= 0)
+        below = (np.minimum(first, last) >= self.height) & \
+                (self.wave_speed <= 0)
+        return above | below
+
+    def retire_waves(self):
+        """
+        Frees the slots of waves that have left their break, see
+        Swell.retire_waves
+        :return: None
+        """
+        retired = self.wave_active & ~self.wave_last_wet & self.has_left()
+        self.wave_active &= ~retired
+        self.n_retired += retired.sum(axis=1)
+
+    def generate_waves(self, spawn):
+        """
+        Starts a new wave in every break where spawn is True
+        :return: None
+        """
+        env_ix = np.flatnonzero(spawn)
+        if len(env_ix) == 0:
+            return
+        if np.any(self.wave_active[env_ix].all(axis=1)):
+            self._grow()
+        slot = np.argmin(self.wave_active[env_ix], axis=1)
+        self.wave_height[env_ix, slot] = self.swell_height[env_ix]
+        self.wave_width[env_ix, slot] = self.swell_width[env_ix]
+        self.wave_angle[env_ix, slot] = self.swell_angle[env_ix]
+        self.wave_speed[env_ix, slot] = self.swell_speed[env_ix]
+        self.wave_counter[env_ix, slot] = 0
+        self.wave_active[env_ix, slot] = True
+        self.wave_wet[env_ix, slot] = False
+        self.wave_last_wet[env_ix, slot] = False
+
+    def _grow(self):
+        n_new = self.max_waves
+        for name in ('wave_height', 'wave_width', 'wave_angle', 'wave_speed',
+                     'wave_counter', 'wave_active', 'wave_wet',
+                     'wave_last_wet'):
+            values = getattr(self, name)
+            padding = np.zeros((self.n_envs, n_new), dtype=values.dtype)
+            if name == 'wave_width':
+                padding += 1
+            setattr(self, name, np.concatenate([values, padding], axis=1))
+
+
+class SurfBreakView:
+    def __init__(self, batch, env_ix):
+        """
+        One break of a BatchedSurfBreak, with the attributes of a SurfBreak
+
+        Grids are views into the batch arrays, so they follow the batch as it
+        steps. Use it wherever a single SurfBreak is read, e.g. as the
+        surfbreak of a Surfer; stepping is done on the batch.
+        """
+        self.batch = batch
+        self.env_ix = env_ix
+        self.height = batch.height
+        self.width = batch.width
+        self.lazy = batch.lazy
+        self.lazy_frame = None
+        self.tile_size = None
+
+    def active_water_level_at(self, ys, xs):
+        return self.active_water_level[ys, xs]
+
+    def crashing_at(self, ys, xs):
+        return self.crashing[ys, xs]
+
+    @property
+    def sea_floor(self):
+        return self.batch.sea_floor[self.env_ix]
+
+    @property
+    def active_water_level(self):
+        return self.batch.active_water_level[self.env_ix]
+
+    @property
+    def crashing(self):
+        return self.batch.crashing[self.env_ix]
+
+    @property
+    def base_water_level(self):
+        return self.batch.base_water_level[self.env_ix]
+
+    @base_water_level.setter
+    def base_water_level(self, value):
+        self.batch.base_water_level[self.env_ix] = value
+
+    @property
+    def water_friction_coef(self):
+        return self.batch.water_friction_coef[self.env_ix]
+
+    @property
+    def counter(self):
+        return self.batch.counter[self.env_ix]
@@ -1,116 +1,245 @@
 import numpy as np
 import gym
 from gym import spaces
-from swell.envs.viz import WAVE_MAX_HEIGHT, SurfBreakViz, SurferViz
+from swell.envs.observation import SurfObservation
 from swell.envs.surfer import Surfer
-import pygame
 
 
 class SurfSesh(gym.Env):
-    metadata = {'render.modes': ['human']}
-
-    def __init__(self, surfer=None, max_timesteps=1000, render=False, fps=5):
+    metadata = {'render.modes': ['human', 'rgb_array']}
+
+    def __init__(self, surfer=None, max_timesteps=1000, render=False, fps=5,
+                 observation=None, reset_pool_size=0, warmup_steps=None,
+                 profiler=None, frame_skip=1):
+        """
+        Gym environment for a single surfer
+
+        observation is a SurfObservation that sets what the grid
+        observations show and their dtype; by default they are the full
+        grids of the surfbreak.
+
+        Unless the observation makes copies, the grids returned by step
+        and reset are views of the surfbreak's buffers: they are valid
+        until the next step overwrites them (or the step after that with a
+        double buffered surfbreak). Copy them, or use
+        SurfObservation(copy=True), to keep them longer.
+
+        reset restores a snapshot of the break and surfer, see
+        SurfBreak.get_state, so episodes do not share waves. By default
+        that is the state they were in when the environment was created.
+        With reset_pool_size, the break is first run for warmup_steps
+        (by default until its first wave has left) and then that many
+        snapshots are taken a random part of a swell period apart; each
+        reset picks one of them, so episodes start among fully formed waves.
+
+        profiler is an optional swell.envs.profiling.Profiler. It is shared
+        with the surfbreak, swell, surfer and viz. Every step then puts the
+        timings of its phases in milliseconds, and the live wave count, in
+        info['profile']; profiler.summary() and profiler.report()
+        aggregate them over all steps.
+
+        With frame_skip, every step repeats the action for that many ticks
+        of the break and returns the summed reward, stopping early at the
+        end of the episode; change_mode is only applied on the first tick.
+        The grids of the skipped ticks are not rasterized, the surfer reads
+        them with point queries, and neither observations nor render frames
+        are built for them.
+        """
         super(SurfSesh, self).__init__()
 
+        if frame_skip < 1:
+            raise ValueError('frame_skip should be at least 1.')
         if surfer is None:
             self.surfer = Surfer()
         else:
             self.surfer = surfer
         self.max_timesteps = max_timesteps
+        self.frame_skip = frame_skip
 
-        # For now observation space will be water height, whether or not the
-        # wave is crashing at each point, position, and speed
-        self.observation_space = spaces.Dict({
-            'active_water_level': spaces.Box(
-                low=self.surfer.surfbreak.base_water_level,
-                high=WAVE_MAX_HEIGHT,
-                shape=(self.surfer.surfbreak.height,
-                       self.surfer.surfbreak.width)
-            ),
-            'crashing': spaces.Box(low=0,
-                                   high=WAVE_MAX_HEIGHT,
-                                   shape=(self.surfer.surfbreak.height,
-                                          self.surfer.surfbreak.width)),
-            'position': spaces.Box(low=np.array([0, 0]),
-                                   high=np.array([
-                                       self.surfer.surfbreak.height,
-                                       self.surfer.surfbreak.width
-                                   ])),
-            'speed': spaces.Box(low=-1 * self.surfer.max_speed,
-                                high=self.surfer.max_speed,
-                                shape=(2,))
-        })
+        if observation is None:
+            observation = SurfObservation()
+        self.observation = observation
+        self.observation_space = self.observation.space(self.surfer.surfbreak,
+                                                        self.surfer.max_speed)
 
         self.action_space = spaces.MultiBinary(n=len(self.surfer.action_space))
 
+        self.profiler = profiler
+        if profiler is not None:
+            self.surfer.profiler = profiler
+            self.surfer.surfbreak.profiler = profiler
+            self.surfer.surfbreak.swell.profiler = profiler
+
+        self.initial_state = self.surfer.surfbreak.get_state()
+        self.initial_surfer_state = self.surfer.get_state()
+        self.reset_pool = []
+        if reset_pool_size:
+            self.build_reset_pool(reset_pool_size, warmup_steps)
+
         self.fps = fps
 
+        # The vizzes are created by render=True or by the first
+        # render('rgb_array') call, and kept in step with the break after that
+        self.sb_viz = None
+        self.surfer_viz = None
+        self.frame = None
+
         self.render_ = render
         if self.render_:
-            self.sb_viz = SurfBreakViz(self.surfer.surfbreak)
-            self.surfer_viz = SurferViz(self.surfer)
+            import pygame
             successes, failures = pygame.init()
-            self.screen = pygame.display.set_mode((self.sb_viz.surfbreak.width,
-                                                   self.sb_viz.surfbreak.height))
-            self.my_font = pygame.font.SysFont("monospace", 16)
-            score_text = self.my_font.render("Stoke: " + str(self.surfer_viz.surfer.total_stoke),
-                                        1, (0, 0, 0))
-            self.screen.blit(score_text, (5, 5))
+            self.screen = pygame.display.set_mode((self.surfer.surfbreak.width,
+                                                   self.surfer.surfbreak.height))
+            self.init_viz()
+            self.draw(self.screen)
 
             self.clock = pygame.time.Clock()
 
-    def step(self, actions):
-        assert len(actions) == len(self.surfer.action_space)
-        actions = dict(zip(self.surfer.action_space, actions))
-        if self.render_:
-            self.sb_viz.step()
-            self.surfer_viz.step(actions)
+    def build_reset_pool(self, size, warmup_steps=None):
+        """
+        Fills reset_pool with size snapshots of a warmed up break
+
+        The break is put back in its initial state afterwards.
+        :return: None
+        """
+        surfbreak = self.surfer.surfbreak
+        swell = surfbreak.swell
+        if warmup_steps is None:
+            n_retired = swell.n_retired
+            for _ in range(self.max_timesteps):
+                if swell.n_retired > n_retired:
+                    break
+                surfbreak.step()
         else:
-            self.surfer.surfbreak.step()
-            self.surfer.step(actions)
+            for _ in range(warmup_steps):
+                surfbreak.step()
+
+        self.reset_pool = []
+        for _ in range(size):
+            for _ in range(np.random.randint(1, swell.period + 1)):
+                surfbreak.step()
+            self.reset_pool.append(surfbreak.get_state())
+
+        surfbreak.set_state(self.initial_state)
+
+    def init_viz(self):
+        """
+        Sets up the break and surfer vizzes, which need no display
+
+        pygame and the vizzes are imported on first use, so environments
+        that never render do not load them.
+        :return: None
+        """
+        import pygame
+        from swell.envs.viz import SurfBreakViz, SurferViz
+
+        self.sb_viz = SurfBreakViz(self.surfer.surfbreak)
+        self.sb_viz.profiler = self.profiler
+        self.surfer_viz = SurferViz(self.surfer)
+        pygame.font.init()
+        self.my_font = pygame.font.SysFont("monospace", 16)
+
+    def draw(self, surface):
+        """
+        Draws the break, the surfer and the score onto surface
+        :return: surface
+        """
+        surface.blit(self.sb_viz.surface, (0, 0))
+        surface.blit(self.surfer_viz.surface,
+                     ((self.surfer.x - self.surfer_viz.sprite_width / 2),
+                      (self.surfer.y - self.surfer_viz.sprite_height / 2)))
+        score_text = self.my_font.render("Stoke: " + str(self.surfer_viz.surfer.total_stoke),
+                                         1, (0, 0, 0))
+        surface.blit(score_text, (5, 5))
 
-        obs = {
-            'active_water_level': self.surfer.surfbreak.active_water_level,
-            'crashing': self.surfer.surfbreak.crashing,
-            'position': [self.surfer.y, self.surfer.x],
-            'speed': self.surfer.speed
-        }
-        reward = self.surfer.get_stoke()
-        done = self.surfer.surfbreak.counter > self.max_timesteps
+        return surface
 
-        return obs, reward, done, {}
+    def step(self, actions):
+        assert len(actions) == len(self.surfer.action_space)
+        profiler = self.profiler
+        if profiler is not None:
+            profiler.begin_step()
+            profiler.start('surfsesh.step')
+        actions = dict(zip(self.surfer.action_space, actions))
+        surfbreak = self.surfer.surfbreak
+        reward = 0
+        for tick in range(self.frame_skip):
+            final = tick == self.frame_skip - 1 or \
+                surfbreak.counter >= self.max_timesteps
+            if final and self.sb_viz is not None:
+                self.sb_viz.step()
+            else:
+                surfbreak.step(defer=not final)
+            if self.surfer_viz is not None:
+                self.surfer_viz.step(actions)
+            else:
+                self.surfer.step(actions)
+            reward += self.surfer.get_stoke()
+            if final:
+                break
+            actions = dict(actions, change_mode=0)
+
+        if profiler is not None:
+            profiler.start('surfsesh.observation')
+        obs = self.observation(self.surfer)
+        if profiler is not None:
+            profiler.stop()
+        done = surfbreak.counter > self.max_timesteps
+
+        info = {}
+        if profiler is not None:
+            profiler.stop()
+            profiler.end_step()
+            info['profile'] = profiler.step_info()
+
+        return obs, reward, done, info
 
     def reset(self):
         # Reset the state of the environment to an initial state
+        if self.reset_pool:
+            state = self.reset_pool[np.random.randint(len(self.reset_pool))]
+        else:
+            state = self.initial_state
+        self.surfer.surfbreak.set_state(state)
         self.surfer.surfbreak.counter = 0
+        self.surfer.set_state(self.initial_surfer_state)
         self.surfer.y = int(np.random.rand() * self.surfer.surfbreak.height)
         self.surfer.x = int(np.random.rand() * self.surfer.surfbreak.width)
-        self.surfer.speed[0] = 0
-        self.surfer.speed[1] = 0
+        self.surfer.speed = (0, 0)
+        if self.sb_viz is not None:
+            # The dirty updates only repaint where waves were, so start over
+            self.sb_viz.init_image()
 
-        return {
-            'active_water_level': self.surfer.surfbreak.active_water_level,
-            'crashing': self.surfer.surfbreak.crashing,
-            'position': [self.surfer.y, self.surfer.x],
-            'speed': self.surfer.speed
-        }
+        return self.observation(self.surfer)
 
     def render(self, mode='human', close=False):
-        # Render the environment to the screen
-        # TO-DO
+        """
+        Renders the environment
+
+        'human' draws to the window opened by render=True, capped at fps.
+        'rgb_array' needs no display and has no frame rate cap; it returns
+        the frame as a (height, width, 3) uint8 array.
+        """
+        import pygame
+
+        if mode == 'rgb_array':
+            if self.sb_viz is None:
+                self.init_viz()
+            if self.frame is None:
+                self.frame = pygame.Surface((self.surfer.surfbreak.width,
+                                             self.surfer.surfbreak.height))
+            self.draw(self.frame)
+            return np.ascontiguousarray(
+                pygame.surfarray.array3d(self.frame).swapaxes(0, 1))
+
         assert self.render_
 
         self.clock.tick(self.fps)
 
-        self.screen.blit(self.sb_viz.surface, (0, 0))
-        self.screen.blit(self.surfer_viz.surface,
-                         ((self.surfer.x - self.surfer_viz.sprite_width / 2),
-                          (self.surfer.y - self.surfer_viz.sprite_height / 2)))
-        score_text = self.my_font.render("Stoke: " + str(self.surfer_viz.surfer.total_stoke),
-                                    1, (0, 0, 0))
-        self.screen.blit(score_text, (5, 5))
+        self.draw(self.screen)
         pygame.display.flip()
 
     def close(self):
-        if self.render_:
+        if self.render_ or self.sb_viz is not None:
+            import pygame
             pygame.quit()
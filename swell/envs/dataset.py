@@ -0,0 +1,332 @@
+import json
+import os
+import gym
+import numpy as np
+'''
+Offline datasets of SurfSesh transitions
+
+TrajectoryRecorder streams the transitions of an environment to a directory
+of fixed size chunks and TrajectoryDataset reads them back. Every row holds
+one observation; a row with valid set is a transition whose action, reward
+and done belong to that observation and whose next observation is the
+following row. The observation an episode ends on is stored as an extra row
+with valid unset, so consecutive observations are never stored twice.
+
+Each chunk also stores the first row of the next chunk, so a transition and
+its next observation always come from the same chunk.
+'''
+
+META_FILE = 'meta.json'
+WAVE_PARAMS = 5
+
+
+def _chunk_name(chunk_ix):
+    return 'chunk_{:05d}'.format(chunk_ix)
+
+
+class TrajectoryRecorder(gym.Wrapper):
+    def __init__(self, env, path, chunk_size=4096, compress=False,
+                 state_only=False, max_waves=32):
+        """
+        Wraps a SurfSesh and records every transition under path
+
+        Rows are collected in preallocated buffers of chunk_size rows and
+        written out when a chunk fills up, so memory use does not grow with
+        the length of the recording. Chunks are written as one .npy file per
+        field, which the reader memory-maps, or with compress as a single
+        compressed .npz file. Observations are stored in the dtype of the
+        observation space.
+
+        With state_only the grid observations are not stored. Rows hold the
+        surfer's position, speed and mode, the tide and the parameters of
+        up to max_waves waves that make up the grids, see
+        SurfBreak.frame_params, from which TrajectoryDataset.regenerate
+        rebuilds the observations exactly.
+
+        Call close, or use the recorder as a context manager, to write the
+        last chunk.
+        """
+        super(TrajectoryRecorder, self).__init__(env)
+        self.path = str(path)
+        self.chunk_size = chunk_size
+        self.compress = compress
+        self.state_only = state_only
+        self.max_waves = max_waves
+        os.makedirs(self.path, exist_ok=True)
+
+        self.specs = self.field_specs()
+        self.buffers = {
+            name: np.zeros((chunk_size + 1,) + shape, dtype=dtype)
+            for name, (shape, dtype) in self.specs.items()
+        }
+        self.n_buffered = 0
+        self.chunks = []
+        self.pending_obs = None
+        self.closed = False
+
+    def field_specs(self):
+        """
+        Shape and dtype of every field of a row
+        :return: dict
+        """
+        specs = {
+            'action': (self.env.action_space.shape, np.int8),
+            'reward': ((), np.float64),
+            'done': ((), bool),
+            'valid': ((), bool),
+        }
+        if self.state_only:
+            specs.update({
+                'state.position': ((2,), np.intp),
+                'state.speed': ((2,), np.float64),
+                'state.mode': ((), np.int8),
+                'state.base_water_level': ((), np.float64),
+                'state.n_waves': ((), np.intp),
+                'state.waves': ((self.max_waves, WAVE_PARAMS), np.float64),
+            })
+        else:
+            for key, space in self.env.observation_space.spaces.items():
+                specs['obs.' + key] = (space.shape, np.dtype(space.dtype))
+        return specs
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def reset(self, **kwargs):
+        if self.pending_obs is not None:
+            # The previous episode was cut short, keep its last observation
+            self.write_row(self.pending_obs)
+        obs = self.env.reset(**kwargs)
+        self.pending_obs = self.capture(obs)
+        return obs
+
+    def step(self, action):
+        obs, reward, done, info = self.env.step(action)
+        self.write_row(self.pending_obs, action, reward, done, valid=True)
+        self.pending_obs = self.capture(obs)
+        if done:
+            self.write_row(self.pending_obs)
+            self.pending_obs = None
+        return obs, reward, done, info
+
+    def capture(self, obs):
+        """
+        The fields of the observation that goes into the next row, copied so
+        the environment can overwrite its buffers
+        :return: dict
+        """
+        if not self.state_only:
+            return {'obs.' + key: np.array(value) for key, value in obs.items()}
+
+        surfer = self.env.surfer
+        surfbreak = surfer.surfbreak
+        params = np.concatenate(surfbreak.frame_params).T
+        if len(params) > self.max_waves:
+            raise ValueError('The break has {} waves, more than max_waves={}.'
+                             .format(len(params), self.max_waves))
+        waves = np.zeros((self.max_waves, WAVE_PARAMS))
+        waves[:len(params)] = params
+        return {
+            'state.position': (surfer.y, surfer.x),
+            'state.speed': surfer.speed.copy(),
+            'state.mode': surfer.mode,
+            'state.base_water_level': surfbreak.base_water_level,
+            'state.n_waves': len(params),
+            'state.waves': waves,
+        }
+
+    def write_row(self, fields, action=0, reward=0, done=False, valid=False):
+        row = self.n_buffered
+        for name, value in fields.items():
+            self.buffers[name][row] = value
+        self.buffers['action'][row] = action
+        self.buffers['reward'][row] = reward
+        self.buffers['done'][row] = done
+        self.buffers['valid'][row] = valid
+        self.n_buffered += 1
+        if self.n_buffered == self.chunk_size + 1:
+            # The extra row goes out with this chunk and starts the next one
+            self.flush(self.chunk_size)
+
+    def flush(self, n_rows):
+        """
+        Writes the first n_rows buffered rows as a chunk, plus the row after
+        them if there is one
+        :return: None
+        """
+        n_stored = min(n_rows + 1, self.n_buffered)
+        name = _chunk_name(len(self.chunks))
+        fields = {field: buffer[:n_stored]
+                  for field, buffer in self.buffers.items()}
+        if self.compress:
+            np.savez_compressed(os.path.join(self.path, name + '.npz'),
+                                **fields)
+        else:
+            os.makedirs(os.path.join(self.path, name), exist_ok=True)
+            for field, values in fields.items():
+                np.save(os.path.join(self.path, name, field + '.npy'), values)
+        self.chunks.append({'name': name, 'rows': n_rows})
+
+        for buffer in self.buffers.values():
+            buffer[:self.n_buffered - n_rows] = \
+                buffer[n_rows:self.n_buffered]
+        self.n_buffered -= n_rows
+        self.write_meta()
+
+    def write_meta(self):
+        meta = {
+            'compress': self.compress,
+            'state_only': self.state_only,
+            'chunk_size': self.chunk_size,
+            'fields': {name: [list(shape), np.dtype(dtype).str]
+                       for name, (shape, dtype) in self.specs.items()},
+            'chunks': self.chunks,
+        }
+        with open(os.path.join(self.path, META_FILE), 'w') as f:
+            json.dump(meta, f, indent=2)
+
+    def close(self):
+        """
+        Writes the rows still buffered and closes the environment
+        :return: None
+        """
+        if self.closed:
+            return
+        if self.pending_obs is not None:
+            self.write_row(self.pending_obs)
+            self.pending_obs = None
+        if self.n_buffered:
+            self.flush(self.n_buffered)
+        self.closed = True
+        self.env.close()
+
+
+class TrajectoryDataset:
+    def __init__(self, path):
+        """
+        Reads a directory written by TrajectoryRecorder
+
+        Uncompressed chunks are memory-mapped and compressed chunks are
+        decompressed one at a time when read, so the dataset never has to
+        fit in memory.
+        """
+        self.path = str(path)
+        with open(os.path.join(self.path, META_FILE)) as f:
+            self.meta = json.load(f)
+        self.fields = list(self.meta['fields'])
+        self.chunk_rows = np.array([chunk['rows']
+                                    for chunk in self.meta['chunks']],
+                                   dtype=np.intp)
+        self.chunk_starts = np.concatenate([[0], np.cumsum(self.chunk_rows)])
+        self.cached_chunk = (None, None)
+
+    def __len__(self):
+        return int(self.chunk_starts[-1])
+
+    @property
+    def n_chunks(self):
+        return len(self.chunk_rows)
+
+    def chunk(self, chunk_ix):
+        """
+        Every field of one chunk, including the row after it
+        :return: dict of arrays
+        """
+        name = self.meta['chunks'][chunk_ix]['name']
+        if not self.meta['compress']:
+            return {field: np.load(os.path.join(self.path, name,
+                                                field + '.npy'),
+                                   mmap_mode='r')
+                    for field in self.fields}
+        if self.cached_chunk[0] != chunk_ix:
+            with np.load(os.path.join(self.path, name + '.npz')) as data:
+                self.cached_chunk = (chunk_ix,
+                                     {field: data[field]
+                                      for field in self.fields})
+        return self.cached_chunk[1]
+
+    def transitions(self, chunk_ix, rows):
+        """
+        Transitions at rows of a chunk, which must all be valid
+        :return: dict with the row fields and, for every observation or
+            state field, the matching 'next.' field
+        """
+        data = self.chunk(chunk_ix)
+        batch = {field: np.asarray(values[rows])
+                 for field, values in data.items()}
+        for field, values in data.items():
+            if field.startswith(('obs.', 'state.')):
+                batch['next.' + field] = np.asarray(values[rows + 1])
+        return batch
+
+    def minibatches(self, batch_size, shuffle=True, rng=None,
+                    drop_last=False):
+        """
+        Iterates over every valid transition once in minibatches
+
+        With shuffle, chunks are visited in random order and the
+        transitions in each chunk are shuffled, so only one chunk is read
+        at a time.
+        :return: iterator of dicts, see transitions
+        """
+        if rng is None:
+            rng = np.random
+        chunk_order = np.arange(self.n_chunks)
+        if shuffle:
+            rng.shuffle(chunk_order)
+        carry = []
+        for chunk_ix in chunk_order:
+            valid = self.chunk(chunk_ix)['valid'][:self.chunk_rows[chunk_ix]]
+            rows = np.flatnonzero(valid)
+            if shuffle:
+                rng.shuffle(rows)
+            for start in range(0, len(rows), batch_size):
+                batch_rows = rows[start:start + batch_size]
+                if len(batch_rows) == batch_size:
+                    yield self.transitions(chunk_ix, batch_rows)
+                else:
+                    carry.append(self.transitions(chunk_ix, batch_rows))
+        # Leftovers of every chunk are combined at the end
+        if carry:
+            leftovers = {field: np.concatenate([batch[field]
+                                                for batch in carry])
+                         for field in carry[0]}
+            n_left = len(leftovers['valid'])
+            for start in range(0, n_left, batch_size):
+                if drop_last and start + batch_size > n_left:
+                    break
+                yield {field: values[start:start + batch_size]
+                       for field, values in leftovers.items()}
+
+    def regenerate(self, batch, surfer, observation, prefix='state.'):
+        """
+        Rebuilds the observations of a state_only batch
+
+        surfer must be in a break built like the recorded one, with the
+        same size and sea floor, and observation is the SurfObservation the
+        recorded SurfSesh used. The surfer and its break are overwritten.
+        Use prefix='next.state.' for the next observations.
+        :return: dict of stacked observations
+        """
+        surfbreak = surfer.surfbreak
+        observations = []
+        for i in range(len(batch[prefix + 'n_waves'])):
+            base_water_level = float(batch[prefix + 'base_water_level'][i])
+            if base_water_level != surfbreak.base_water_level:
+                surfbreak.base_water_level = base_water_level
+            waves = batch[prefix + 'waves'][i, :batch[prefix + 'n_waves'][i]]
+            heights, widths, angles, speeds, counters = waves.T[:, None]
+            surfbreak.rasterize_frame((heights, widths.astype(np.intp),
+                                       angles, speeds,
+                                       counters.astype(np.intp)))
+            surfer.y, surfer.x = batch[prefix + 'position'][i].tolist()
+            surfer.speed = batch[prefix + 'speed'][i]
+            surfer.mode = int(batch[prefix + 'mode'][i])
+            obs = observation(surfer)
+            observations.append({key: np.array(value)
+                                 for key, value in obs.items()})
+        return {key: np.stack([obs[key] for obs in observations])
+                for key in observations[0]}
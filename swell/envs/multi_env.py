@@ -0,0 +1,130 @@
+import numpy as np
+from gym import spaces
+from swell.envs.observation import SurfObservation
+from swell.envs.surf import SurfBreak
+from swell.envs.surfer import SurferBatch
+
+try:
+    from pettingzoo import ParallelEnv
+except ImportError:
+    # The PettingZoo API is followed either way, the base class only adds
+    # a few conveniences
+    ParallelEnv = object
+
+
+class MultiSurfSesh(ParallelEnv):
+    metadata = {'render.modes': [], 'name': 'swell_multi_v0'}
+
+    def __init__(self, n_surfers=2, surfers=None, max_timesteps=1000,
+                 observation=None):
+        """
+        Several surfers sharing one surfbreak, with the PettingZoo
+        ParallelEnv API
+
+        The break is stepped once per tick for everyone, and the surfers
+        are stored as one SurferBatch, so their kinematics, including the
+        wave speed lookups in crashing, are computed together. Observations,
+        rewards, terminations, truncations and infos are dicts keyed by
+        agent name, 'surfer_0' to 'surfer_{n_surfers - 1}'.
+
+        surfers is a SurferBatch on a SurfBreak; by default one with
+        n_surfers surfers is built on a default break. observation is a
+        SurfObservation applied to every agent, see SurfSesh. Like
+        SurfSesh, reset puts the break back in its initial state.
+        """
+        if surfers is None:
+            surfers = SurferBatch(SurfBreak(), n_surfers=n_surfers)
+        self.surfers = surfers
+        self.surfbreak = surfers.surfbreak
+        self.max_timesteps = max_timesteps
+
+        self.possible_agents = ['surfer_{}'.format(i)
+                                for i in range(surfers.n_surfers)]
+        self.agents = list(self.possible_agents)
+
+        if observation is None:
+            observation = SurfObservation()
+        self.observation = observation
+        self.observation_spaces = dict.fromkeys(
+            self.possible_agents,
+            self.observation.space(self.surfbreak, self.surfers.max_speed)
+        )
+        self.action_spaces = dict.fromkeys(
+            self.possible_agents,
+            spaces.MultiBinary(n=len(self.surfers.action_space))
+        )
+
+        self.initial_state = self.surfbreak.get_state()
+        self.rng = np.random.RandomState()
+
+    def observation_space(self, agent):
+        return self.observation_spaces[agent]
+
+    def action_space(self, agent):
+        return self.action_spaces[agent]
+
+    def _get_obs(self):
+        if self.observation.mode == 'full' and self.observation.dtype is None \
+                and not self.observation.copy:
+            # Everyone sees the same grids, so share one set of views
+            grids = self.observation(self.surfers[0])
+            return {
+                agent: dict(grids,
+                            position=[int(self.surfers.y[i]),
+                                      int(self.surfers.x[i])],
+                            speed=self.surfers.speed[i])
+                for i, agent in enumerate(self.possible_agents)
+            }
+        return {agent: self.observation(self.surfers[i])
+                for i, agent in enumerate(self.possible_agents)}
+
+    def reset(self, seed=None, options=None):
+        # Reset the state of the environment to an initial state
+        if seed is not None:
+            self.rng = np.random.RandomState(seed)
+        self.agents = list(self.possible_agents)
+        self.surfbreak.set_state(self.initial_state)
+        self.surfbreak.counter = 0
+        n_surfers = self.surfers.n_surfers
+        self.surfers.y = (self.rng.rand(n_surfers) *
+                          self.surfbreak.height).astype(np.intp)
+        self.surfers.x = (self.rng.rand(n_surfers) *
+                          self.surfbreak.width).astype(np.intp)
+        self.surfers.speed = np.zeros((n_surfers, 2))
+        self.surfers.mode = np.zeros(n_surfers, dtype=np.intp)
+        self.surfers.total_stoke = np.zeros(n_surfers)
+
+        return self._get_obs(), {agent: {} for agent in self.agents}
+
+    def step(self, actions):
+        """
+        Moves the break and all surfers one tick forward
+        :param actions: dict of agent name to action, agents without an
+            action do nothing
+        :return: observations, rewards, terminations, truncations, infos
+        """
+        batch_actions = np.zeros((self.surfers.n_surfers,
+                                  len(self.surfers.action_space)),
+                                 dtype=np.intp)
+        for i, agent in enumerate(self.possible_agents):
+            if agent in actions:
+                batch_actions[i] = actions[agent]
+
+        self.surfbreak.step()
+        self.surfers.step(batch_actions)
+
+        obs = self._get_obs()
+        stoke = self.surfers.get_stoke()
+        truncated = self.surfbreak.counter > self.max_timesteps
+        rewards = {agent: float(stoke[i])
+                   for i, agent in enumerate(self.possible_agents)}
+        terminations = dict.fromkeys(self.possible_agents, False)
+        truncations = dict.fromkeys(self.possible_agents, truncated)
+        infos = {agent: {} for agent in self.possible_agents}
+        if truncated:
+            self.agents = []
+
+        return obs, rewards, terminations, truncations, infos
+
+    def close(self):
+        pass
@@ -0,0 +1,268 @@
+import numpy as np
+from gym import spaces
+from swell.envs.palette import WAVE_MAX_HEIGHT
+from swell.envs.tiles import TiledGrid
+
+OBS_MODES = ('full', 'window', 'downsample')
+POOLS = ('stride', 'mean', 'max')
+GRID_KEYS = ('active_water_level', 'crashing')
+
+
+def window_cells(y, x, height, width, grid_height, grid_width):
+    """
+    Rows and columns of the height x width window centered on (y, x), with
+    the edge rows and columns of the grid repeated outwards
+    :return: (height, 1) rows and (width,) columns
+    """
+    y0 = y - height // 2
+    x0 = x - width // 2
+    rows = np.clip(np.arange(y0, y0 + height), 0, grid_height - 1)
+    columns = np.clip(np.arange(x0, x0 + width), 0, grid_width - 1)
+    return rows[:, None], columns
+
+
+def window(grid, y, x, height, width):
+    """
+    height x width window of grid centered on (y, x)
+
+    Returns a view when the window lies inside the grid. Otherwise the
+    window is gathered with the edge rows and columns repeated outwards.
+    """
+    y0 = y - height // 2
+    x0 = x - width // 2
+    if y0 >= 0 and x0 >= 0 and y0 + height <= grid.shape[0] and \
+            x0 + width <= grid.shape[1]:
+        return grid[y0:y0 + height, x0:x0 + width]
+    return grid[window_cells(y, x, height, width, *grid.shape)]
+
+
+def downsample(grid, factor, pool='stride'):
+    """
+    Shrinks grid by factor along both axes
+
+    'stride' keeps every factor-th cell and returns a view; 'mean' and
+    'max' pool factor x factor blocks, dropping incomplete blocks at the
+    edges. A TiledGrid is pooled tile by tile, see downsample_tiles.
+    """
+    if pool == 'stride':
+        return grid[::factor, ::factor]
+    if isinstance(grid, TiledGrid):
+        return downsample_tiles(grid, factor, pool)
+    height = grid.shape[0] // factor
+    width = grid.shape[1] // factor
+    return pool_blocks(grid[:height * factor, :width * factor], factor, pool)
+
+
+def pool_blocks(grid, factor, pool):
+    """
+    Pools the factor x factor blocks of grid, whose sides are multiples
+    of factor, with 'mean' or 'max'
+
+    The mean adds the cells of each block in the same order whatever the
+    memory layout of grid, so a tiled grid pools to exactly the values of
+    its dense counterpart.
+    """
+    if pool == 'max':
+        return grid.reshape(grid.shape[0] // factor, factor,
+                            grid.shape[1] // factor, factor).max(axis=(1, 3))
+    total = grid[::factor, ::factor].astype(
+        np.result_type(grid.dtype, np.float32))
+    for i in range(factor):
+        for j in range(factor):
+            if i or j:
+                total += grid[i::factor, j::factor]
+    return total / (factor * factor)
+
+
+def downsample_tiles(grid, factor, pool):
+    """
+    downsample with 'mean' or 'max' for a TiledGrid, without assembling
+    the dense grid
+
+    Blocks that only cover fill tiles all pool to the same value, so the
+    fill tile is pooled once. Every stored tile then pools the blocks it
+    overlaps, reading them from the tiles with TiledGrid.window.
+    """
+    height = grid.shape[0] // factor
+    width = grid.shape[1] // factor
+    fill = pool_blocks(np.full((factor, factor), grid.fill,
+                               dtype=grid.dtype), factor, pool)
+    out = np.full((height, width), fill[0, 0], dtype=fill.dtype)
+    tile_size = grid.tile_size
+    for tile_y, tile_x in zip(*np.nonzero(grid.tile_ix >= 0)):
+        # Output cells whose blocks overlap the tile
+        y0 = tile_y * tile_size // factor
+        y1 = min(-(-(tile_y + 1) * tile_size // factor), height)
+        x0 = tile_x * tile_size // factor
+        x1 = min(-(-(tile_x + 1) * tile_size // factor), width)
+        if y1 <= y0 or x1 <= x0:
+            continue
+        out[y0:y1, x0:x1] = pool_blocks(
+            grid.window(y0 * factor, y1 * factor, x0 * factor, x1 * factor),
+            factor, pool)
+
+    return out
+
+
+class SurfObservation:
+    def __init__(self, mode='full',
+                 window_size=64,
+                 downsample_factor=2,
+                 pool='stride',
+                 dtype=None,
+                 copy=False):
+        """
+        Builds SurfSesh observations and the matching observation space
+
+        mode picks what the grid observations (active_water_level and
+        crashing) show:
+        - 'full': the whole grid
+        - 'window': a window_size window centered on the surfer, edges are
+          padded by repeating the border cells
+        - 'downsample': the whole grid shrunk by downsample_factor, see
+          downsample for the pool options
+
+        dtype converts the grid observations: None keeps the break's arrays
+        as they are, 'float32' casts and 'uint8' quantizes each channel's
+        range in the observed break onto 0-255, see grid_ranges. Without a conversion, 'full'
+        mode, windows inside the grid and 'stride' pooling return views of
+        the break's arrays, which the break overwrites on its next step.
+        Set copy to always return arrays the caller owns.
+
+        With a lazy surfbreak, 'window' observations are evaluated cell by
+        cell with point queries, so the break's grids are never rasterized.
+        With a tiled surfbreak, 'window' and 'downsample' observations are
+        read from the tiles they cover, and 'full' observations assemble
+        the dense grids.
+        """
+        if mode not in OBS_MODES:
+            raise ValueError('mode should be one of {}.'.format(OBS_MODES))
+        if pool not in POOLS:
+            raise ValueError('pool should be one of {}.'.format(POOLS))
+        if np.ndim(window_size) == 0:
+            window_size = (window_size, window_size)
+        self.mode = mode
+        self.window_size = tuple(window_size)
+        self.downsample_factor = downsample_factor
+        self.pool = pool
+        self.dtype = None if dtype is None else np.dtype(dtype)
+        self.copy = copy
+
+    def grid_shape(self, height, width):
+        if self.mode == 'window':
+            return self.window_size
+        if self.mode == 'downsample':
+            factor = self.downsample_factor
+            if self.pool == 'stride':
+                return -(-height // factor), -(-width // factor)
+            return height // factor, width // factor
+        return height, width
+
+    def grid_ranges(self, surfbreak):
+        """
+        Range of values of each grid observation in surfbreak
+        :return: dict of (low, high) tuples
+        """
+        return {
+            'active_water_level': (float(np.min(surfbreak.base_water_level)),
+                                   WAVE_MAX_HEIGHT),
+            'crashing': (0, WAVE_MAX_HEIGHT)
+        }
+
+    def space(self, surfbreak, max_speed):
+        """
+        Observation space of a single surfer in surfbreak
+        :return: spaces.Dict
+        """
+        shape = self.grid_shape(surfbreak.height, surfbreak.width)
+        ranges = self.grid_ranges(surfbreak)
+
+        def grid_space(low, high):
+            if self.dtype == np.uint8:
+                return spaces.Box(low=0, high=255, shape=shape,
+                                  dtype=np.uint8)
+            if self.dtype is None:
+                return spaces.Box(low=low, high=high, shape=shape)
+            return spaces.Box(low=low, high=high, shape=shape,
+                              dtype=self.dtype)
+
+        # For now observation space will be water height, whether or not the
+        # wave is crashing at each point, position, and speed
+        return spaces.Dict({
+            'active_water_level': grid_space(*ranges['active_water_level']),
+            'crashing': grid_space(*ranges['crashing']),
+            'position': spaces.Box(low=np.array([0, 0]),
+                                   high=np.array([
+                                       surfbreak.height,
+                                       surfbreak.width
+                                   ])),
+            'speed': spaces.Box(low=-1 * max_speed,
+                                high=max_speed,
+                                shape=(2,))
+        })
+
+    def grid(self, key, grid, surfer):
+        source = grid
+        if self.mode == 'window':
+            grid = window(grid, surfer.y, surfer.x, *self.window_size)
+        elif self.mode == 'downsample':
+            grid = downsample(grid, self.downsample_factor, self.pool)
+        if not isinstance(grid, np.ndarray):
+            # A TiledGrid in 'full' mode; what is read from tiles is
+            # assembled into new arrays, which share no memory with them
+            grid = np.asarray(grid)
+        if not isinstance(source, np.ndarray):
+            source = None
+        return self.convert(key, grid, surfer.surfbreak, source)
+
+    def convert(self, key, grid, surfbreak, source=None):
+        """
+        Applies dtype to a grid observation of surfbreak, copying it if it
+        shares memory with source and copy is set
+        """
+        if self.dtype == np.uint8:
+            low, high = self.grid_ranges(surfbreak)[key]
+            scaled = (grid - low) * (255 / (high - low))
+            return np.clip(scaled, 0, 255, out=scaled).astype(np.uint8)
+        if self.dtype is not None:
+            return grid.astype(self.dtype)
+        if self.copy and source is not None and \
+                np.may_share_memory(grid, source):
+            return grid.copy()
+        return grid
+
+    def __call__(self, surfer):
+        """
+        Observation of surfer in its surfbreak
+        :return: dict
+        """
+        surfbreak = surfer.surfbreak
+        if surfbreak.lazy and self.mode == 'window':
+            cells = window_cells(surfer.y, surfer.x, *self.window_size,
+                                 surfbreak.height, surfbreak.width)
+            return {
+                'active_water_level': self.convert(
+                    'active_water_level',
+                    surfbreak.active_water_level_at(*cells), surfbreak),
+                'crashing': self.convert('crashing',
+                                         surfbreak.crashing_at(*cells),
+                                         surfbreak),
+                'position': [surfer.y, surfer.x],
+                'speed': surfer.speed.copy()
+            }
+        return {
+            'active_water_level': self.grid('active_water_level',
+                                            surfbreak.active_water_level,
+                                            surfer),
+            'crashing': self.grid('crashing', surfbreak.crashing, surfer),
+            'position': [surfer.y, surfer.x],
+            'speed': surfer.speed.copy()
+        }
+
+
+def surf_observation_space(surfbreak, max_speed):
+    """
+    Full grid observation space of a single surfer in surfbreak
+    :return: spaces.Dict
+    """
+    return SurfObservation().space(surfbreak, max_speed)
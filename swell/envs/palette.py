@@ -0,0 +1,31 @@
+import numpy as np
+'''
+Value ranges and colors shared by the renderer and the observations. This
+module only needs NumPy, so the simulation can use it without pulling in
+pygame.
+'''
+
+WAVE_MAX_HEIGHT = 20
+SEAFLOOR_MIN_HEIGHT = -20
+# seaborn's color_palette('Blues', n_colors=80)[40:] scaled to 0-255,
+# stored as a table so importing the renderer does not need seaborn
+SEA_COLOR_PALETTE = [
+    (105, 172, 213), (101, 170, 211), (97, 167, 210), (92, 163, 208),
+    (88, 161, 206), (84, 158, 205), (80, 155, 203), (76, 153, 202),
+    (72, 150, 200), (67, 147, 198), (64, 144, 197), (61, 141, 195),
+    (58, 138, 193), (55, 135, 192), (51, 131, 190), (48, 128, 189),
+    (44, 124, 187), (41, 121, 185), (38, 118, 183), (35, 115, 182),
+    (32, 112, 180), (30, 109, 178), (26, 105, 174), (24, 102, 172),
+    (22, 99, 170), (19, 96, 167), (17, 93, 165), (15, 90, 163),
+    (12, 86, 160), (9, 83, 157), (8, 80, 154), (8, 76, 150),
+    (8, 73, 145), (8, 70, 140), (8, 66, 134), (8, 63, 130),
+    (8, 60, 125), (8, 57, 120), (8, 54, 116), (8, 51, 111),
+]
+CRASH_COLOR = (255, 255, 255)
+BEACH_COLOR = (230, 207, 138)
+WAVE_BREAK_RATIO = 2
+
+# Lookup tables for the vectorized renderer
+SEA_COLOR_LUT = np.array(SEA_COLOR_PALETTE, dtype=np.uint8)
+CRASH_RGB = np.array(CRASH_COLOR, dtype=np.uint8)
+BEACH_RGB = np.array(BEACH_COLOR, dtype=np.uint8)
@@ -0,0 +1,164 @@
+import cProfile
+import time
+import tracemalloc
+'''
+Opt-in instrumentation of the simulation hot paths
+
+SurfBreak, Swell, Surfer, SurfBreakViz and SurfSesh all have a profiler
+attribute that is None by default, in which case the only cost is one
+attribute check per phase. Assign a Profiler, or pass one to SurfSesh, to
+collect per-phase timings.
+'''
+
+
+class Profiler:
+    def __init__(self, track_memory=False, cprofile_start=None,
+                 cprofile_steps=100, cprofile_path='swell.prof'):
+        """
+        Collects per-phase timers, call counts and gauges
+
+        Phases are timed with start and stop and may nest, e.g.
+        'surfbreak.crash' runs inside 'surfbreak.rasterize'. Gauges such as
+        the number of live waves are recorded with record.
+
+        track_memory measures the bytes each phase allocates at its peak
+        with tracemalloc, which slows everything down considerably.
+
+        With cprofile_start, the steps from cprofile_start to
+        cprofile_start + cprofile_steps, as counted by end_step, are run
+        under cProfile and the stats are dumped to cprofile_path.
+        """
+        self.track_memory = track_memory
+        self.cprofile_start = cprofile_start
+        self.cprofile_steps = cprofile_steps
+        self.cprofile_path = cprofile_path
+        self.cprofile = None
+        self.stack = []
+        self.reset()
+
+    def reset(self):
+        """
+        Clears everything collected so far
+        :return: None
+        """
+        self.totals = {}
+        self.calls = {}
+        self.peak_bytes = {}
+        self.gauges = {}
+        self.step_totals = {}
+        self.n_steps = 0
+
+    def start(self, name):
+        if self.track_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            current, peak = tracemalloc.get_traced_memory()
+            if self.stack:
+                # Keep the parent's peak before the child resets it
+                parent = self.stack[-1]
+                parent[3] = max(parent[3], peak)
+            tracemalloc.reset_peak()
+            self.stack.append([name, time.perf_counter(), current, current])
+        else:
+            self.stack.append([name, time.perf_counter()])
+
+    def stop(self):
+        end = time.perf_counter()
+        frame = self.stack.pop()
+        name = frame[0]
+        seconds = end - frame[1]
+        self.totals[name] = self.totals.get(name, 0) + seconds
+        self.calls[name] = self.calls.get(name, 0) + 1
+        self.step_totals[name] = self.step_totals.get(name, 0) + seconds
+        if self.track_memory:
+            peak = max(frame[3], tracemalloc.get_traced_memory()[1])
+            self.peak_bytes[name] = max(self.peak_bytes.get(name, 0),
+                                        peak - frame[2])
+            if self.stack:
+                parent = self.stack[-1]
+                parent[3] = max(parent[3], peak)
+
+    def record(self, name, value):
+        """
+        Records the current value of a gauge, e.g. the number of live waves
+        :return: None
+        """
+        gauge = self.gauges.get(name)
+        if gauge is None:
+            self.gauges[name] = {'last': value, 'max': value, 'total': value,
+                                 'count': 1}
+        else:
+            gauge['last'] = value
+            gauge['max'] = max(gauge['max'], value)
+            gauge['total'] += value
+            gauge['count'] += 1
+
+    def begin_step(self):
+        """
+        Starts a new environment step; step_info covers the phases from here
+        :return: None
+        """
+        self.step_totals = {}
+        if self.cprofile_start is not None and \
+                self.n_steps == self.cprofile_start:
+            self.cprofile = cProfile.Profile()
+            self.cprofile.enable()
+
+    def end_step(self):
+        self.n_steps += 1
+        if self.cprofile is not None and self.n_steps >= \
+                self.cprofile_start + self.cprofile_steps:
+            self.cprofile.disable()
+            self.cprofile.dump_stats(self.cprofile_path)
+            self.cprofile = None
+
+    def step_info(self):
+        """
+        Timings of the current step in milliseconds, with the last value of
+        every gauge
+        :return: dict
+        """
+        info = {name: seconds * 1e3
+                for name, seconds in self.step_totals.items()}
+        info.update((name, gauge['last'])
+                    for name, gauge in self.gauges.items())
+        return info
+
+    def summary(self):
+        """
+        Everything collected since the last reset
+        :return: dict with a 'phases' dict of calls, total_ms and mean_us
+            (and peak_bytes with track_memory) per phase, and a 'gauges'
+            dict of last, max and mean per gauge
+        """
+        phases = {}
+        for name, seconds in self.totals.items():
+            phases[name] = {
+                'calls': self.calls[name],
+                'total_ms': seconds * 1e3,
+                'mean_us': seconds * 1e6 / self.calls[name],
+            }
+            if name in self.peak_bytes:
+                phases[name]['peak_bytes'] = self.peak_bytes[name]
+        gauges = {name: {'last': gauge['last'], 'max': gauge['max'],
+                         'mean': gauge['total'] / gauge['count']}
+                  for name, gauge in self.gauges.items()}
+        return {'steps': self.n_steps, 'phases': phases, 'gauges': gauges}
+
+    def report(self):
+        """
+        summary formatted as a table, slowest phases first
+        :return: str
+        """
+        summary = self.summary()
+        lines = ['{:<24} {:>10} {:>12} {:>12} {:>12}'.format(
+            'phase', 'calls', 'total ms', 'mean us', 'peak bytes')]
+        for name, phase in sorted(summary['phases'].items(),
+                                  key=lambda item: -item[1]['total_ms']):
+            lines.append('{:<24} {:>10} {:>12.2f} {:>12.2f} {:>12}'.format(
+                name, phase['calls'], phase['total_ms'], phase['mean_us'],
+                phase.get('peak_bytes', '-')))
+        for name, gauge in sorted(summary['gauges'].items()):
+            lines.append('{:<24} last {} max {} mean {:.2f}'.format(
+                name, gauge['last'], gauge['max'], gauge['mean']))
+        return '\n'.join(lines)
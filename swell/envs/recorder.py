@@ -0,0 +1,115 @@
+import subprocess
+import numpy as np
+from numpy.lib import format as npy_format
+
+NPY_HEADER_SIZE = 256
+
+
+def _npy_header(shape, dtype):
+    """
+    Version 1.0 .npy header padded to NPY_HEADER_SIZE bytes, so it can be
+    rewritten in place once the final number of frames is known
+    """
+    header = "{{'descr': {!r}, 'fortran_order': False, 'shape': {}, }}".format(
+        npy_format.dtype_to_descr(np.dtype(dtype)), tuple(shape))
+    preamble = npy_format.magic(1, 0)
+    padding = NPY_HEADER_SIZE - len(preamble) - 2 - len(header) - 1
+    if padding < 0:
+        raise ValueError('Frame shape {} is too long for the header.'.format(
+            shape))
+    header = (header + ' ' * padding + '\n').encode('latin1')
+    return preamble + len(header).to_bytes(2, 'little') + header
+
+
+class FrameRecorder:
+    def __init__(self, path, chunk_size=64, fps=30, command=None):
+        """
+        Streams rendered frames to disk in chunks
+
+        Frames are collected in a preallocated buffer of chunk_size frames
+        and written out whenever it fills up, so long rollouts never hold
+        more than one chunk in memory.
+
+        A path ending in .npy gets a (frames, height, width, 3) uint8 .npy
+        file that can be opened with np.load(path, mmap_mode='r'). Any other
+        path is encoded by piping raw RGB frames into ffmpeg at fps, or into
+        command if given: a list of arguments where '{width}', '{height}'
+        and '{fps}' are filled in and the frames arrive on stdin.
+
+        Use it as a context manager, or call close when done:
+
+            with FrameRecorder('rollout.npy') as recorder:
+                for _ in range(n_steps):
+                    env.step(action)
+                    recorder.add_frame(env.render(mode='rgb_array'))
+        """
+        self.path = str(path)
+        self.chunk_size = chunk_size
+        self.fps = fps
+        self.command = command
+        self.buffer = None
+        self.n_buffered = 0
+        self.n_frames = 0
+        self.file = None
+        self.process = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _open(self, frame):
+        self.buffer = np.empty((self.chunk_size,) + frame.shape,
+                               dtype=np.uint8)
+        if self.path.endswith('.npy'):
+            self.file = open(self.path, 'wb')
+            self.file.write(_npy_header((0,) + frame.shape, np.uint8))
+        else:
+            height, width = frame.shape[:2]
+            command = self.command
+            if command is None:
+                command = ['ffmpeg', '-y', '-loglevel', 'error',
+                           '-f', 'rawvideo', '-pix_fmt', 'rgb24',
+                           '-s', '{width}x{height}', '-r', '{fps}',
+                           '-i', '-', '-pix_fmt', 'yuv420p', self.path]
+            command = [arg.format(width=width, height=height, fps=self.fps)
+                       for arg in command]
+            self.process = subprocess.Popen(command, stdin=subprocess.PIPE)
+            self.file = self.process.stdin
+
+    def add_frame(self, frame):
+        """
+        Queues one (height, width, 3) frame, writing a chunk when full
+        :return: None
+        """
+        if self.buffer is None:
+            self._open(frame)
+        self.buffer[self.n_buffered] = frame
+        self.n_buffered += 1
+        if self.n_buffered == self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if self.n_buffered:
+            self.file.write(self.buffer[:self.n_buffered].tobytes())
+            self.n_frames += self.n_buffered
+            self.n_buffered = 0
+
+    def close(self):
+        """
+        Writes out the last chunk and finalizes the file or encoder
+        :return: None
+        """
+        if self.file is None:
+            return
+        self.flush()
+        if self.process is None:
+            self.file.seek(0)
+            self.file.write(_npy_header((self.n_frames,) +
+                                        self.buffer.shape[1:], np.uint8))
+            self.file.close()
+        else:
+            self.file.close()
+            self.process.wait()
+        self.file = None
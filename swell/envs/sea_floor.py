@@ -0,0 +1,161 @@
+from collections import OrderedDict
+from functools import partial
+import numpy as np
+'''
+Sea floor generators
+
+Every generator takes the grid height and width first and returns a
+(height, width) array of sea floor heights. Cells where the floor is at or
+above the tide are beach. Use functools.partial to set the other parameters
+when passing a generator to SurfBreak as sea_floor_func.
+'''
+
+SEA_FLOOR_CACHE_SIZE = 32
+_sea_floor_cache = OrderedDict()
+
+
+def _grid(height, width):
+    y = np.arange(height)[:, None]
+    x = np.arange(width)[None, :]
+    return y, x
+
+
+def flat_sea_floor(height, width, depth):
+    return np.full((height, width), depth, dtype=float)
+
+
+def angled_sea_floor(height, width,
+                     parallel_coef=0.03,
+                     perp_coef=.25,
+                     low_depth=50):
+    y, x = _grid(height, width)
+    return y * parallel_coef + x * perp_coef - low_depth
+
+
+def reef_sea_floor(height, width,
+                   depth=-20,
+                   reef_height=0,
+                   reef_y=None,
+                   reef_x=None,
+                   radius=30):
+    """
+    Flat bottom with a round reef rising to reef_height, centered on the
+    grid by default
+    """
+    if reef_y is None:
+        reef_y = height / 2
+    if reef_x is None:
+        reef_x = width / 2
+    y, x = _grid(height, width)
+    distance = np.square(y - reef_y) + np.square(x - reef_x)
+    return depth + (reef_height - depth) * \
+        np.exp(-distance / (2 * radius ** 2))
+
+
+def point_break_sea_floor(height, width,
+                          parallel_coef=0.03,
+                          perp_coef=.25,
+                          low_depth=50,
+                          point_y=None,
+                          point_length=None,
+                          point_radius=20):
+    """
+    Angled sea floor with a headland sticking out of the beach
+
+    The point sits at row point_y and reaches point_length columns out from
+    the edge of the beach.
+    """
+    if point_y is None:
+        point_y = height / 2
+    if point_length is None:
+        point_length = width / 3
+    y, x = _grid(height, width)
+    floor = angled_sea_floor(height, width, parallel_coef, perp_coef,
+                             low_depth)
+    point = perp_coef * point_length * \
+        np.exp(-np.square((y - point_y) / point_radius))
+    return floor + point
+
+
+def sandbar_sea_floor(height, width,
+                      parallel_coef=0.03,
+                      perp_coef=.25,
+                      low_depth=50,
+                      bar_x=None,
+                      bar_height=8,
+                      bar_width=8):
+    """
+    Angled sea floor with a sandbar running parallel to the beach at
+    column bar_x
+    """
+    if bar_x is None:
+        bar_x = width / 2
+    y, x = _grid(height, width)
+    floor = angled_sea_floor(height, width, parallel_coef, perp_coef,
+                             low_depth)
+    return floor + bar_height * np.exp(-np.square((x - bar_x) / bar_width))
+
+
+def file_sea_floor(height, width, path, dtype=np.float64, offset=0):
+    """
+    Memory-maps a real bathymetry instead of generating one
+
+    .npy files are opened with np.load(mmap_mode='r'); anything else is
+    read as raw, row-major values of dtype starting at byte offset. Nothing
+    is copied, so large floors cost no memory until they are read.
+    """
+    if str(path).endswith('.npy'):
+        floor = np.load(path, mmap_mode='r')
+    else:
+        floor = np.memmap(path, dtype=dtype, mode='r', offset=offset,
+                          shape=(height, width))
+    if floor.shape != (height, width):
+        raise ValueError('Sea floor in {} has shape {}, expected {}.'.format(
+            path, floor.shape, (height, width)))
+    return floor
+
+
+def _cache_key(sea_floor_func):
+    if isinstance(sea_floor_func, partial):
+        return (_cache_key(sea_floor_func.func), sea_floor_func.args,
+                tuple(sorted(sea_floor_func.keywords.items())))
+    return sea_floor_func
+
+
+def cached_sea_floor(sea_floor_func, height, width, cache=True):
+    """
+    Builds a sea floor through a process wide LRU cache
+
+    Floors are keyed on the generator, including the arguments bound with
+    functools.partial, and the grid size. Cached floors are read-only and
+    shared by every break that uses them, so replace a break's sea_floor
+    rather than editing it in place. Generators with unhashable arguments
+    are not cached.
+
+    The cache assumes generators are deterministic. Pass cache=False for
+    random floors, so every call draws a new one; the floor is then a
+    private, writable array.
+    :return: (height, width) array, read-only if it came from the cache
+    """
+    if not cache:
+        return np.asarray(sea_floor_func(height, width))
+    key = (_cache_key(sea_floor_func), height, width)
+    try:
+        floor = _sea_floor_cache.pop(key)
+    except KeyError:
+        floor = np.asarray(sea_floor_func(height, width))
+        floor.flags.writeable = False
+    except TypeError:
+        floor = np.asarray(sea_floor_func(height, width))
+        floor.flags.writeable = False
+        return floor
+
+    _sea_floor_cache[key] = floor
+    while len(_sea_floor_cache) > SEA_FLOOR_CACHE_SIZE:
+        _sea_floor_cache.popitem(last=False)
+
+    return floor
+
+
+def clear_sea_floor_cache():
+    _sea_floor_cache.clear()
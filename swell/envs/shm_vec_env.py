@@ -0,0 +1,272 @@
+import os
+import multiprocessing as mp
+from multiprocessing import shared_memory
+import numpy as np
+from gym import spaces
+from stable_baselines3.common.vec_env.base_vec_env import CloudpickleWrapper, \
+    VecEnv
+
+
+def _obs_buffers(shms, specs):
+    return {key: np.ndarray(shape, dtype=dtype, buffer=shms[key].buf)
+            for key, (shape, dtype) in specs.items()}
+
+
+def _worker(remote, parent_remote, env_fn_wrappers, cpus):
+    """
+    Runs a few SurfSesh environments in a subprocess
+
+    Observations are written straight into the shared memory buffers set
+    up by the 'attach' command; only actions, rewards, dones and infos go
+    through the pipe.
+    """
+    # Import here to avoid a circular import
+    from stable_baselines3.common.env_util import is_wrapped
+
+    parent_remote.close()
+    if cpus is not None and hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cpus)
+    envs = [env_fn() for env_fn in env_fn_wrappers.var]
+    shms = {}
+    buffers = {}
+    offset = 0
+
+    def write(i, obs):
+        for key, buffer in buffers.items():
+            value = np.asarray(obs if key is None else obs[key])
+            # Casts within a kind, e.g. float64 grids into float32 buffers,
+            # are expected; anything else means the space is wrong
+            if not np.can_cast(value.dtype, buffer.dtype,
+                               casting='same_kind'):
+                raise TypeError(
+                    'Observation {!r} has dtype {}, which does not fit the '
+                    'observation space dtype {}.'.format(key, value.dtype,
+                                                         buffer.dtype))
+            buffer[offset + i] = value
+
+    while True:
+        try:
+            cmd, data = remote.recv()
+            if cmd == 'step':
+                rewards = np.zeros(len(envs))
+                dones = np.zeros(len(envs), dtype=bool)
+                infos = []
+                for i, (env, action) in enumerate(zip(envs, data)):
+                    obs, rewards[i], dones[i], info = env.step(action)
+                    if dones[i]:
+                        # Terminal observations are rare, so they are
+                        # copied through the pipe
+                        info['terminal_observation'] = {
+                            key: np.array(value) for key, value in obs.items()
+                        }
+                        obs = env.reset()
+                    write(i, obs)
+                    infos.append(info)
+                remote.send((rewards, dones, infos))
+            elif cmd == 'reset':
+                for i, env in enumerate(envs):
+                    write(i, env.reset())
+                remote.send(None)
+            elif cmd == 'attach':
+                names, specs, offset = data
+                shms = {key: shared_memory.SharedMemory(name=name)
+                        for key, name in names.items()}
+                buffers = _obs_buffers(shms, specs)
+                remote.send(None)
+            elif cmd == 'seed':
+                remote.send([env.seed(data + i) if hasattr(env, 'seed')
+                             else None for i, env in enumerate(envs)])
+            elif cmd == 'close':
+                for env in envs:
+                    env.close()
+                buffers = {}
+                for shm in shms.values():
+                    shm.close()
+                remote.close()
+                break
+            elif cmd == 'get_spaces':
+                remote.send((envs[0].observation_space, envs[0].action_space))
+            elif cmd == 'env_method':
+                env_ix, name, args, kwargs = data
+                remote.send([getattr(envs[i], name)(*args, **kwargs)
+                             for i in env_ix])
+            elif cmd == 'get_attr':
+                env_ix, name = data
+                remote.send([getattr(envs[i], name) for i in env_ix])
+            elif cmd == 'set_attr':
+                env_ix, name, value = data
+                for i in env_ix:
+                    setattr(envs[i], name, value)
+                remote.send(None)
+            elif cmd == 'is_wrapped':
+                env_ix, wrapper_class = data
+                remote.send([is_wrapped(envs[i], wrapper_class)
+                             for i in env_ix])
+            else:
+                raise NotImplementedError(
+                    '`{}` is not implemented in the worker'.format(cmd))
+        except EOFError:
+            break
+
+
+class SharedMemoryVecEnv(VecEnv):
+    def __init__(self, env_fns, n_workers=None, cpu_affinity=None,
+                 start_method=None):
+        """
+        Process pool VecEnv for SurfSesh with zero-copy observations
+
+        Works like stable-baselines3's SubprocVecEnv, except that workers
+        write observations into preallocated multiprocessing.shared_memory
+        buffers, one (n_envs, ...) array per observation key, instead of
+        pickling the water level and crashing grids through a pipe.
+
+        The observations returned by reset and step_wait are views of those
+        buffers: they are overwritten by the next step, so copy them if they
+        need to outlive it. Buffers use the dtype of the observation space,
+        and observations are cast to it: within a kind, such as float64
+        grids into a float32 space, the values are rounded without a
+        warning, while a cast to another kind, such as floats into a uint8
+        space, raises TypeError in the worker.
+
+        :param env_fns: functions that build each environment
+        :param n_workers: number of processes, the environments are split
+            evenly between them. Defaults to one per environment, capped at
+            the number of CPUs.
+        :param cpu_affinity: optional list with one set of CPU ids per
+            worker, applied with os.sched_setaffinity where available
+        :param start_method: multiprocessing start method, defaults to
+            'forkserver' where available and 'spawn' otherwise
+        """
+        self.waiting = False
+        self.closed = False
+        n_envs = len(env_fns)
+        if n_workers is None:
+            n_workers = min(n_envs, os.cpu_count() or 1)
+        if cpu_affinity is not None and len(cpu_affinity) != n_workers:
+            raise ValueError('cpu_affinity needs one set of CPUs per worker.')
+
+        if start_method is None:
+            forkserver_available = 'forkserver' in mp.get_all_start_methods()
+            start_method = 'forkserver' if forkserver_available else 'spawn'
+        ctx = mp.get_context(start_method)
+
+        self.env_ix = [ix for ix in np.array_split(np.arange(n_envs), n_workers)
+                       if len(ix)]
+        self.remotes, self.work_remotes = zip(*[ctx.Pipe()
+                                                for _ in self.env_ix])
+        self.processes = []
+        for worker, (work_remote, remote, env_ix) in enumerate(
+                zip(self.work_remotes, self.remotes, self.env_ix)):
+            cpus = None if cpu_affinity is None else cpu_affinity[worker]
+            args = (work_remote, remote,
+                    CloudpickleWrapper([env_fns[i] for i in env_ix]), cpus)
+            # daemon=True: if the main process crashes, we should not cause
+            # things to hang
+            process = ctx.Process(target=_worker, args=args, daemon=True)
+            process.start()
+            self.processes.append(process)
+            work_remote.close()
+
+        self.remotes[0].send(('get_spaces', None))
+        observation_space, action_space = self.remotes[0].recv()
+        VecEnv.__init__(self, n_envs, observation_space, action_space)
+
+        if isinstance(observation_space, spaces.Dict):
+            obs_spaces = observation_space.spaces
+        else:
+            obs_spaces = {None: observation_space}
+        specs = {key: ((n_envs,) + space.shape, np.dtype(space.dtype))
+                 for key, space in obs_spaces.items()}
+        self.shms = {
+            key: shared_memory.SharedMemory(
+                create=True, size=max(int(np.prod(shape)) * dtype.itemsize, 1)
+            )
+            for key, (shape, dtype) in specs.items()
+        }
+        self.buffers = _obs_buffers(self.shms, specs)
+        names = {key: shm.name for key, shm in self.shms.items()}
+        for remote, env_ix in zip(self.remotes, self.env_ix):
+            remote.send(('attach', (names, specs, env_ix[0])))
+        for remote in self.remotes:
+            remote.recv()
+
+    def _get_obs(self):
+        if None in self.buffers:
+            return self.buffers[None]
+        return dict(self.buffers)
+
+    def step_async(self, actions):
+        for remote, env_ix in zip(self.remotes, self.env_ix):
+            remote.send(('step', actions[env_ix]))
+        self.waiting = True
+
+    def step_wait(self):
+        results = [remote.recv() for remote in self.remotes]
+        self.waiting = False
+        rewards, dones, infos = zip(*results)
+        return self._get_obs(), np.concatenate(rewards), \
+            np.concatenate(dones), sum(infos, [])
+
+    def reset(self):
+        for remote in self.remotes:
+            remote.send(('reset', None))
+        for remote in self.remotes:
+            remote.recv()
+        return self._get_obs()
+
+    def seed(self, seed=None):
+        if seed is None:
+            seed = np.random.randint(0, 2 ** 32 - 1)
+        for remote, env_ix in zip(self.remotes, self.env_ix):
+            remote.send(('seed', seed + int(env_ix[0])))
+        return sum([remote.recv() for remote in self.remotes], [])
+
+    def close(self):
+        if self.closed:
+            return
+        if self.waiting:
+            for remote in self.remotes:
+                remote.recv()
+        for remote in self.remotes:
+            remote.send(('close', None))
+        for process in self.processes:
+            process.join()
+        self.buffers = {}
+        for shm in self.shms.values():
+            shm.close()
+            shm.unlink()
+        self.closed = True
+
+    def _route(self, cmd, indices, *data):
+        """
+        Sends cmd to the workers hosting indices and gathers the replies in
+        index order
+        """
+        indices = list(self._get_indices(indices))
+        replies = {}
+        for remote, env_ix in zip(self.remotes, self.env_ix):
+            local = [i - env_ix[0] for i in indices if i in env_ix]
+            if local:
+                remote.send((cmd, (local,) + data))
+                for i, reply in zip(local, remote.recv()):
+                    replies[env_ix[0] + i] = reply
+        return [replies[i] for i in indices]
+
+    def get_attr(self, attr_name, indices=None):
+        return self._route('get_attr', indices, attr_name)
+
+    def set_attr(self, attr_name, value, indices=None):
+        indices = list(self._get_indices(indices))
+        for remote, env_ix in zip(self.remotes, self.env_ix):
+            local = [i - env_ix[0] for i in indices if i in env_ix]
+            if local:
+                remote.send(('set_attr', (local, attr_name, value)))
+                remote.recv()
+
+    def env_method(self, method_name, *method_args, indices=None,
+                   **method_kwargs):
+        return self._route('env_method', indices, method_name, method_args,
+                           method_kwargs)
+
+    def env_is_wrapped(self, wrapper_class, indices=None):
+        return self._route('is_wrapped', indices, wrapper_class)
@@ -1,4 +1,8 @@
+from collections import OrderedDict
 import numpy as np
+from swell.envs.sea_floor import flat_sea_floor, angled_sea_floor, \
+    cached_sea_floor
+from swell.envs.tiles import TiledGrid, band_tiles
 '''
 To-do:
 - ride-mode
@@ -13,43 +17,270 @@ To-do:
 '''
 
 
-def flat_sea_floor(height, width, depth):
-    return np.zeros((height, width)) + depth
+def crash_intensity(wave_height, wave_width, offset, depth):
+    """
+    Crashing value of the cell offset rows into a wave band
 
+    depth is the height of the still water above the sea floor,
+    base_water_level - sea_floor. Works on scalars and arrays alike.
+    """
+    return np.log(
+        (-1 * ((2 * wave_height / wave_width) * np.abs((wave_width / 2) - offset)
+               - wave_height) /
+         depth) + 1
+    )
 
-def angled_sea_floor(height, width,
-                     parallel_coef=0.03,
-                     perp_coef=.25,
-                     low_depth=50):
-    floor = np.zeros((height, width))
-    for x in range(width):
-        for y in range(height):
-            floor[y, x] = y * parallel_coef + x * perp_coef - low_depth
 
-    return floor
+def band_tops(angles, speeds, counters, width):
+    """
+    Top row of every band in every column of a grid width columns wide
+
+    astype truncates towards zero like int() does.
+    :return: intp array with the shape of the parameters plus (width,)
+    """
+    columns = np.arange(width)
+    return (angles[..., None] * columns
+            - (counters * speeds)[..., None]).astype(np.intp)
+
+
+# A band with no cells on the grid
+EMPTY_BAND = (0, np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.intp))
+# No cells, as y and x index arrays
+EMPTY_CELLS = EMPTY_BAND[1:]
+
+
+def grid_bands(tops, widths, height):
+    """
+    Clips bands to a grid height rows tall
+
+    A band is stored as (x0, y0, y1): column x0 + i holds rows y0[i] up to
+    y1[i]. The top row of a band is monotonic in x, so the columns where
+    it overlaps the grid are contiguous and only those are kept.
+    :param tops: (waves, width) array from band_tops
+    :param widths: (waves,) band widths
+    :return: list of bands, one per wave
+    """
+    y0 = np.maximum(tops, 0)
+    y1 = np.minimum(tops + widths[:, None], height)
+    on_grid = y1 > y0
+    starts = on_grid.argmax(axis=1).tolist()
+    stops = (tops.shape[1] - on_grid[:, ::-1].argmax(axis=1)).tolist()
+    bands = []
+    for wave_ix, any_on_grid in enumerate(on_grid.any(axis=1).tolist()):
+        if not any_on_grid:
+            bands.append(EMPTY_BAND)
+            continue
+        x0, x1 = starts[wave_ix], stops[wave_ix]
+        bands.append((x0, y0[wave_ix, x0:x1], y1[wave_ix, x0:x1]))
+
+    return bands
+
+
+def band_cells(band):
+    """
+    Expands a band from grid_bands into its cells, column by column
+    :return: y and x index arrays
+    """
+    x0, y0, y1 = band
+    counts = y1 - y0
+    xs = np.repeat(np.arange(x0, x0 + len(y0)), counts)
+    # Row offset of every cell within its column
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts,
+                                                  counts)
+    ys = np.repeat(y0, counts) + offsets
+
+    return ys, xs
+
+
+def frame_nbytes(frame):
+    """
+    Size of a frame cache entry of SurfBreak
+    :return: number of bytes
+    """
+    active_water_level, crashing, bands, wet_cells = frame
+    return active_water_level.nbytes + crashing.nbytes + \
+        sum(y0.nbytes + y1.nbytes for _, y0, y1 in bands) + \
+        sum(ys.nbytes + xs.nbytes for ys, xs in wet_cells)
+
+
+def rasterize_bands(active_water_level, crashing, sea_floor,
+                    base_water_level, heights, widths, angles, speeds,
+                    counters, active=None, crash_lookup=None,
+                    grid_index=None):
+    """
+    Writes wave bands onto a stack of break grids in place
+
+    The grids have shape (envs, height, width) and base_water_level has
+    shape (envs,). Wave parameters have shape (envs, waves) and must be in
+    the order the waves were generated, oldest first; active masks out
+    unused wave slots. Water levels are summed in wave order with
+    np.add.at and, where bands overlap, the crashing value of the youngest
+    wave wins, which matches writing the waves one cell at a time.
+
+    crash_lookup(env_ix, wave_ix, offset_ix, ys, xs) can supply
+    precomputed crashing values for the given cells instead of evaluating
+    crash_intensity.
+
+    grid_index(env_ix, ys, xs) can map the band cells to an index into
+    water level and crashing arrays of another layout than the sea floor,
+    e.g. the tiles of a TiledGrid.
+    :return: env, wave, y and x indices of the wet band cells
+    """
+    n_envs, height, width = sea_floor.shape
+    if heights.size == 0:
+        empty = np.zeros(0, dtype=np.intp)
+        return empty, empty, empty, empty
+
+    # Top row of every band, shape (envs, waves, width)
+    tops = band_tops(angles, speeds, counters, width)
+
+    # Band rows, shape (envs, waves, width, max wave width)
+    offsets = np.arange(widths.max())
+    rows = tops[:, :, :, None] + offsets
+    in_band = (offsets < widths[:, :, None, None]) & \
+              (rows >= 0) & (rows < height)
+    if active is not None:
+        in_band &= active[:, :, None, None]
+
+    # np.nonzero walks the mask in (env, wave, x, i) order, the same order
+    # as the loop, which keeps the summation order of np.add.at identical.
+    env_ix, wave_ix, xs, offset_ix = np.nonzero(in_band)
+    ys = rows[env_ix, wave_ix, xs, offset_ix]
+    if grid_index is None:
+        index = (env_ix, ys, xs)
+    else:
+        index = grid_index(env_ix, ys, xs)
+    np.add.at(active_water_level, index, heights[env_ix, wave_ix])
+
+    floor = sea_floor[env_ix, ys, xs]
+    base = base_water_level[env_ix]
+    wet = base > floor
+    env_ix, wave_ix, xs, ys = env_ix[wet], wave_ix[wet], xs[wet], ys[wet]
+    offset_ix = offset_ix[wet]
+    if grid_index is not None:
+        index = tuple(ix[wet] for ix in index)
+
+    # Last write wins: keep the final occurrence of every cell and only
+    # evaluate the crashing values that survive
+    cells = (env_ix * height + ys) * width + xs
+    _, last = np.unique(cells[::-1], return_index=True)
+    last = len(cells) - 1 - last
+    if crash_lookup is None:
+        crash = crash_intensity(heights[env_ix[last], wave_ix[last]],
+                                widths[env_ix[last], wave_ix[last]],
+                                offset_ix[last],
+                                base[wet][last] - floor[wet][last])
+    else:
+        crash = crash_lookup(env_ix[last], wave_ix[last], offset_ix[last],
+                             ys[last], xs[last])
+    if grid_index is None:
+        crashing.reshape(-1)[cells[last]] = crash
+    else:
+        crashing[tuple(ix[last] for ix in index)] = crash
+
+    return env_ix, wave_ix, ys, xs
 
 
 class SurfBreak:
+    # Optional swell.envs.profiling.Profiler
+    profiler = None
+
     def __init__(self, height=200,
                  width=200,
                  sea_floor_func=angled_sea_floor,
                  tide_init=1,
                  swell=None,
-                 water_friction_coef=1):
+                 water_friction_coef=1,
+                 vectorized=True,
+                 crash_table_max_bytes=2 ** 26,
+                 dtype=np.float64,
+                 double_buffer=False,
+                 frame_cache_max_bytes=0,
+                 lazy=False,
+                 tile_size=None,
+                 cache_sea_floor=True):
         """
         Defines a break environment
 
         Defines a surf break environment that is a 2D grid with characteristics
         at each coordinate including, seafloor height, water height, and
         whether or not the water is crashing
+
+        The sea floor comes from sea_floor_func through cached_sea_floor,
+        so breaks with the same generator and size share one read-only
+        floor. Set cache_sea_floor to False for a generator that draws a
+        random floor, to give this break a floor of its own.
+
+        vectorized selects the NumPy wave rasterizer; set it to False to use
+        the original cell by cell loop. The vectorized rasterizer reads
+        crashing values from a precomputed table per wave shape, see
+        crash_table. crash_table_max_bytes caps the total size of the
+        tables; the least recently used ones are dropped to stay under it,
+        and so are the tables of shapes no live wave has any more.
+
+        active_water_level and crashing are preallocated arrays of dtype
+        that are refilled in place every step, so a reference to them
+        always shows the latest step. With double_buffer the break
+        alternates between two sets of arrays instead, so the arrays of the
+        previous step stay untouched for one more step.
+
+        With frame_cache_max_bytes, the grids and wave bands of each
+        step are cached, keyed on the tide and the shape and counter of
+        every live wave, which determine them completely. A fixed swell
+        repeats the same set of waves every period once its first wave has
+        left the break, so from then on steps copy cached frames instead of
+        rasterizing. Frames are only stored from that point on and the least
+        recently used ones are dropped to stay under the cap. Any change to
+        the tide, sea floor or swell shows up as a new key, so it falls back
+        to rasterizing.
+
+        lazy skips rasterizing in step and only keeps the wave parameters.
+        active_water_level_at and crashing_at then evaluate single cells
+        analytically, so the cost of a step no longer grows with the grid,
+        and the grids are only rasterized when they are read. Wave
+        bands are not tracked in lazy mode and the frame cache is
+        not used.
+
+        With tile_size, active_water_level and crashing are TiledGrids of
+        tile_size x tile_size tiles, for breaks too large for dense grids.
+        A step only allocates and writes the tiles the wave bands run
+        through; all other tiles are still water and share one constant
+        tile. Observations and SurfBreakViz read the tiles directly, only
+        'full' observations assemble the dense grids. The sea floor never
+        changes, so it stays a dense array shared by every break of the
+        same size and floor, see cached_sea_floor; a sea_floor_func can
+        return a np.memmap to keep it on disk. Tiling needs the vectorized
+        rasterizer.
         """
 
         self.height = height
         self.width = width
-        self.sea_floor = sea_floor_func(height, width)
+        self.crash_table_max_bytes = crash_table_max_bytes
+        self.crash_tables = OrderedDict()
+        self.crash_tables_bytes = 0
+        self.frame_cache_max_bytes = frame_cache_max_bytes
+        self.frame_cache = OrderedDict()
+        self.frame_cache_bytes = 0
+        self.sea_floor = cached_sea_floor(sea_floor_func, height, width,
+                                          cache=cache_sea_floor)
         self.base_water_level = tide_init
-        self.active_water_level = np.zeros((height, width)) + tide_init
-        self.crashing = np.zeros((height, width))
+        self.dtype = np.dtype(dtype)
+        if tile_size is not None and not vectorized:
+            raise ValueError('tile_size needs the vectorized rasterizer.')
+        self.tile_size = tile_size
+        if tile_size is None:
+            self.grid_buffers = [
+                (np.full((height, width), tide_init, dtype=self.dtype),
+                 np.zeros((height, width), dtype=self.dtype))
+                for _ in range(2 if double_buffer else 1)
+            ]
+        else:
+            self.grid_buffers = [
+                (TiledGrid(height, width, tile_size, tide_init, self.dtype),
+                 TiledGrid(height, width, tile_size, 0, self.dtype))
+                for _ in range(2 if double_buffer else 1)
+            ]
+        self.active_water_level, self.crashing = self.grid_buffers[0]
         if swell is None:
             self.swell = Swell()
         else:
@@ -57,22 +288,461 @@ class SurfBreak:
         if water_friction_coef > 1 or water_friction_coef < 0:
             raise ValueError('water_friction_coef should be between 0 and 1.')
         self.water_friction_coef = water_friction_coef
+        self.vectorized = vectorized
+        self.lazy = lazy
+        # Wave parameters of the frame that has not been rasterized yet
+        self.lazy_frame = None
+        # Wave parameters of the current grids, see wave_params. Together
+        # with the tide they determine the grids completely.
+        self.frame_params = tuple(np.zeros((1, 0)) for _ in range(5))
 
         self.counter = 0
 
-    def step(self):
+    @property
+    def active_water_level(self):
+        if self.lazy_frame is not None:
+            self.materialize()
+        return self._active_water_level
+
+    @active_water_level.setter
+    def active_water_level(self, active_water_level):
+        self._active_water_level = active_water_level
+
+    @property
+    def crashing(self):
+        if self.lazy_frame is not None:
+            self.materialize()
+        return self._crashing
+
+    @crashing.setter
+    def crashing(self, crashing):
+        self._crashing = crashing
+
+    @property
+    def sea_floor(self):
+        return self._sea_floor
+
+    @sea_floor.setter
+    def sea_floor(self, sea_floor):
+        self._sea_floor = sea_floor
+        self.invalidate_caches()
+
+    @property
+    def base_water_level(self):
+        return self._base_water_level
+
+    @base_water_level.setter
+    def base_water_level(self, base_water_level):
+        self._base_water_level = base_water_level
+        self.invalidate_caches()
+
+    def invalidate_caches(self):
+        """
+        Drops the precomputed crashing values and cached frames
+
+        Called whenever sea_floor or base_water_level is assigned. Call it
+        yourself after editing sea_floor in place.
+        :return: None
+        """
+        self.invalidate_crash_tables()
+        self.frame_cache.clear()
+        self.frame_cache_bytes = 0
+
+    def invalidate_crash_tables(self):
+        """
+        Drops the precomputed crashing values
+        :return: None
+        """
+        self.crash_tables.clear()
+        self.crash_tables_bytes = 0
+
+    def crash_table(self, wave_height, wave_width):
+        """
+        Crashing values of every band offset at every cell for one wave shape
+
+        The crashing value only depends on the wave shape, the offset into
+        the band and the depth of the cell, so it is computed once per shape
+        and cached until the tide or sea floor changes. Entries for dry
+        cells are meaningless. The least recently used tables are dropped
+        to keep all of them within crash_table_max_bytes.
+        :return: (wave_width, height, width) array, or None if it would be
+            larger than crash_table_max_bytes
+        """
+        key = (wave_height, wave_width)
+        table = self.crash_tables.get(key)
+        if table is not None:
+            self.crash_tables.move_to_end(key)
+            return table
+
+        n_bytes = wave_width * self.height * self.width * 8
+        if n_bytes > self.crash_table_max_bytes:
+            return None
+        while self.crash_tables_bytes + n_bytes > self.crash_table_max_bytes:
+            _, dropped = self.crash_tables.popitem(last=False)
+            self.crash_tables_bytes -= dropped.nbytes
+        offsets = np.arange(wave_width)[:, None, None]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            table = crash_intensity(wave_height, wave_width, offsets,
+                                    self.base_water_level - self.sea_floor)
+        self.crash_tables[key] = table
+        self.crash_tables_bytes += table.nbytes
+        return table
+
+    def drop_crash_tables(self, shapes):
+        """
+        Drops the tables of wave shapes other than shapes, a set of
+        (height, width) pairs
+        :return: None
+        """
+        for key in [key for key in self.crash_tables if key not in shapes]:
+            self.crash_tables_bytes -= self.crash_tables.pop(key).nbytes
+
+    def step(self, defer=False):
         """
         Moves break one time step forward
+
+        With defer the grids of this step are not rasterized, as in lazy
+        mode: the point queries still see the step and reading a grid
+        rasterizes it. Wave bands are not updated and waves are not
+        retired on a deferred step, so a SurfBreakViz repaints correctly
+        on the next step that is not deferred.
         :return: None
         """
-        self.active_water_level = np.zeros((self.height, self.width)) + \
-                                  self.base_water_level
-        self.crashing = np.zeros((self.height, self.width))
+        profiler = self.profiler
+        if profiler is not None:
+            profiler.start('surfbreak.step')
+            profiler.start('surfbreak.rasterize')
+        if self.lazy or defer:
+            self.lazy_frame = self.frame_params = self.wave_params()
+        else:
+            # A frame left pending by a deferred step is never read now
+            self.lazy_frame = None
+            if not self.load_frame():
+                if self.vectorized:
+                    self.rasterize_waves()
+                else:
+                    self.rasterize_waves_loop()
+                self.store_frame()
+        if profiler is not None:
+            profiler.stop()
+            profiler.start('surfbreak.waves')
+
+        # Retire before stepping so has_left sees the band just rasterized
+        if not defer:
+            self.swell.retire_waves(self.height, self.width)
         for wave in self.swell.waves:
-            wave.last_coordinates = wave.coordinates
-            wave.coordinates = []
+            wave.step()
+        if profiler is not None:
+            profiler.stop()
+
+        self.swell.step()
+
+        self.counter += 1
+        if profiler is not None:
+            profiler.record('waves.live', self.swell.n_live)
+            profiler.record('waves.retired', self.swell.n_retired)
+            profiler.stop()
+
+    def step_n(self, n_steps):
+        """
+        Moves break n_steps time steps forward, only rasterizing the grids
+        of the last one
+        :return: None
+        """
+        if n_steps < 1:
+            raise ValueError('n_steps should be at least 1.')
+        for _ in range(n_steps - 1):
+            self.step(defer=True)
+        self.step()
+
+    def materialize(self):
+        """
+        Rasterizes the frame a lazy break skipped
+        :return: None
+        """
+        self.rasterize_frame(self.lazy_frame)
+
+    def rasterize_frame(self, frame_params):
+        """
+        Redraws the grids from the wave parameters of a frame, e.g. a
+        frame_params recorded earlier, without touching the swell
+        :return: None
+        """
+        self.lazy_frame = None
+        self.frame_params = frame_params
+        self.clear_grids()
+        if frame_params[0].size:
+            self.rasterize_params(*frame_params)
+
+    def lazy_cells(self, ys, xs):
+        """
+        Yields every wave of the pending lazy frame, oldest first, with the
+        offset of each cell into its band and whether the cell is in the band
+        """
+        heights, widths, angles, speeds, counters = self.lazy_frame
+        for wave_ix in range(heights.shape[1]):
+            # Same arithmetic as rasterize_bands, so the rows agree
+            top = (angles[0, wave_ix] * xs -
+                   counters[0, wave_ix] * speeds[0, wave_ix]).astype(np.intp)
+            offset = ys - top
+            in_band = (offset >= 0) & (offset < widths[0, wave_ix])
+            yield heights[0, wave_ix], widths[0, wave_ix], offset, in_band
+
+    def active_water_level_at(self, ys, xs):
+        """
+        Water level at cells (ys, xs) without rasterizing a lazy break
+        :return: array with the broadcast shape of ys and xs
+        """
+        if self.lazy_frame is None:
+            return self._active_water_level[ys, xs]
+        ys, xs = np.broadcast_arrays(ys, xs)
+        level = np.full(ys.shape, self.base_water_level, dtype=self.dtype)
+        for height, _, _, in_band in self.lazy_cells(ys, xs):
+            level[in_band] += height
+        return level
+
+    def crashing_at(self, ys, xs):
+        """
+        Crashing values at cells (ys, xs) without rasterizing a lazy break
+        :return: array with the broadcast shape of ys and xs
+        """
+        if self.lazy_frame is None:
+            return self._crashing[ys, xs]
+        ys, xs = np.broadcast_arrays(ys, xs)
+        crashing = np.zeros(ys.shape, dtype=self.dtype)
+        depth = self.base_water_level - self.sea_floor[ys, xs]
+        wet = depth > 0
+        # The youngest wave covering a wet cell wins, as when rasterizing
+        for height, width, offset, in_band in self.lazy_cells(ys, xs):
+            in_band &= wet
+            with np.errstate(divide='ignore', invalid='ignore'):
+                crashing[in_band] = crash_intensity(height, width,
+                                                    offset[in_band],
+                                                    depth[in_band])
+        return crashing
+
+    def frame_key(self):
+        return (self.base_water_level,
+                tuple((wave.height, wave.width, wave.angle, wave.speed,
+                       wave.counter) for wave in self.swell.waves))
+
+    def load_frame(self):
+        """
+        Fills the grids and wave bands from the frame cache
+        :return: whether the current frame was cached
+        """
+        if not self.frame_cache_max_bytes:
+            return False
+        key = self.frame_key()
+        frame = self.frame_cache.get(key)
+        if frame is None:
+            return False
+        self.frame_cache.move_to_end(key)
+        self.frame_params = self.wave_params()
+
+        active_water_level, crashing, bands, wet_cells = frame
+        if len(self.grid_buffers) > 1:
+            self.grid_buffers.reverse()
+        self.active_water_level, self.crashing = self.grid_buffers[0]
+        self.copy_grids(active_water_level, crashing)
+        for wave, band, cells in zip(self.swell.waves, bands, wet_cells):
+            wave.update_cells(band, cells)
+
+        return True
+
+    def store_frame(self):
+        """
+        Adds the frame just rasterized to the frame cache, once the swell
+        has become periodic
+        :return: None
+        """
+        if not self.frame_cache_max_bytes or not self.swell.n_retired:
+            return
+        bands = [(x0, y0.copy(), y1.copy())
+                 for x0, y0, y1 in (wave.band for wave in self.swell.waves)]
+        wet_cells = [(ys.copy(), xs.copy())
+                     for ys, xs in (wave.wet_cells
+                                    for wave in self.swell.waves)]
+        frame = (self.active_water_level.copy(), self.crashing.copy(), bands,
+                 wet_cells)
+        n_bytes = frame_nbytes(frame)
+        if n_bytes > self.frame_cache_max_bytes:
+            return
+
+        self.frame_cache[self.frame_key()] = frame
+        self.frame_cache_bytes += n_bytes
+        while self.frame_cache_bytes > self.frame_cache_max_bytes:
+            _, frame = self.frame_cache.popitem(last=False)
+            self.frame_cache_bytes -= frame_nbytes(frame)
+
+    def get_state(self):
+        """
+        Snapshot of everything that changes as the break steps
+
+        The grids are copied, so the snapshot stays valid while the break
+        keeps stepping. The sea floor is not included, it never changes.
+        :return: dict to pass to set_state
+        """
+        return {
+            'counter': self.counter,
+            'base_water_level': self.base_water_level,
+            'active_water_level': self.active_water_level.copy(),
+            'crashing': self.crashing.copy(),
+            'frame_params': self.frame_params,
+            'swell': self.swell.get_state()
+        }
+
+    def set_state(self, state):
+        """
+        Restores a snapshot from get_state
+
+        The grids are copied into the break's current buffers, so the
+        snapshot can be restored any number of times.
+        :return: None
+        """
+        self.lazy_frame = None
+        self.counter = state['counter']
+        if state['base_water_level'] != self.base_water_level:
+            self.base_water_level = state['base_water_level']
+        self.copy_grids(state['active_water_level'], state['crashing'])
+        self.frame_params = state['frame_params']
+        self.swell.set_state(state['swell'])
+
+    def copy_grids(self, active_water_level, crashing):
+        """
+        Copies grids, e.g. of a snapshot, into the current buffers
+        :return: None
+        """
+        if self.tile_size is None:
+            np.copyto(self.active_water_level, active_water_level)
+            np.copyto(self.crashing, crashing)
+        else:
+            self.active_water_level.assign(active_water_level)
+            self.crashing.assign(crashing)
+
+    def clear_grids(self):
+        """
+        Resets active_water_level and crashing to still water in place,
+        moving to the other buffer first when double buffered
+        :return: None
+        """
+        if len(self.grid_buffers) > 1:
+            self.grid_buffers.reverse()
+        self.active_water_level, self.crashing = self.grid_buffers[0]
+        if self.tile_size is None:
+            self.active_water_level.fill(self.base_water_level)
+            self.crashing.fill(0)
+        else:
+            self.active_water_level.clear(self.base_water_level)
+            self.crashing.clear(0)
+
+    def rasterize_waves(self):
+        """
+        Writes every wave of the swell onto the water level and crashing grids
+
+        Vectorized over all waves, columns and band offsets at once with
+        rasterize_bands; the output is identical to rasterize_waves_loop.
+        :return: None
+        """
+        self.clear_grids()
+        waves = self.swell.waves
+        self.frame_params = self.wave_params()
+        if not waves:
+            return
+
+        wave_ix, ys, xs = self.rasterize_params(*self.frame_params)
+
+        heights, widths, angles, speeds, counters = self.frame_params
+        tops = band_tops(angles[0], speeds[0], counters[0], self.width)
+        bounds = np.cumsum(np.bincount(wave_ix, minlength=len(waves)))[:-1]
+        for wave, band, wave_ys, wave_xs in zip(
+                waves, grid_bands(tops, widths[0], self.height),
+                np.split(ys, bounds), np.split(xs, bounds)):
+            wave.update_cells(band, (wave_ys, wave_xs))
+
+    def wave_params(self):
+        """
+        Heights, widths, angles, speeds and counters of the live waves
+        :return: tuple of (1, waves) arrays
+        """
+        waves = self.swell.waves
+        return (np.array([[wave.height for wave in waves]]),
+                np.array([[wave.width for wave in waves]]),
+                np.array([[wave.angle for wave in waves]]),
+                np.array([[wave.speed for wave in waves]]),
+                np.array([[wave.counter for wave in waves]]))
+
+    def rasterize_params(self, heights, widths, angles, speeds, counters):
+        """
+        Writes the waves given by (1, waves) parameter arrays onto the grids
+        :return: wave, y and x indices of the wet band cells
+        """
+        shapes = set(zip(heights[0].tolist(), widths[0].tolist()))
+        self.drop_crash_tables(shapes)
+        tables = {shape: self.crash_table(*shape) for shape in shapes}
+
+        def crash_lookup(env_ix, wave_ix, offset_ix, ys, xs):
+            if self.profiler is not None:
+                self.profiler.start('surfbreak.crash')
+            crash = np.zeros(len(ys))
+            for (height, width), table in tables.items():
+                if len(tables) == 1:
+                    shape = slice(None)
+                else:
+                    shape = (heights[0, wave_ix] == height) & \
+                            (widths[0, wave_ix] == width)
+                if table is None:
+                    depth = self.base_water_level - self.sea_floor[ys[shape],
+                                                                   xs[shape]]
+                    crash[shape] = crash_intensity(height, width,
+                                                   offset_ix[shape], depth)
+                else:
+                    crash[shape] = table[offset_ix[shape], ys[shape],
+                                         xs[shape]]
+            if self.profiler is not None:
+                self.profiler.stop()
+            return crash
+
+        if self.tile_size is None:
+            grids = self.active_water_level[None], self.crashing[None]
+            grid_index = None
+        else:
+            # Only the tiles the bands run through are stored
+            water, crash = self.active_water_level, self.crashing
+            touched = band_tiles(band_tops(angles[0], speeds[0],
+                                           counters[0], self.width),
+                                 widths[0], self.height, self.tile_size)
+            water.allocate(touched)
+            crash.allocate(touched)
+            grids = water.tiles, crash.tiles
+
+            def grid_index(env_ix, ys, xs):
+                return water.local(ys, xs)
+
+        _, wave_ix, ys, xs = rasterize_bands(
+            grids[0], grids[1], self.sea_floor[None],
+            np.array([self.base_water_level]),
+            heights, widths, angles, speeds, counters,
+            crash_lookup=crash_lookup, grid_index=grid_index
+        )
+
+        return wave_ix, ys, xs
+
+    def rasterize_waves_loop(self):
+        """
+        Reference implementation of rasterize_waves, one cell at a time
+        :return: None
+        """
+        self.clear_grids()
+        self.frame_params = self.wave_params()
+        for wave in self.swell.waves:
+            columns = []
+            wet_cells = []
             for x in range(self.width):
                 y = int(wave.angle * x - wave.counter * wave.speed)
+                rows = (max(y, 0), min(y + wave.width, self.height))
+                if rows[1] > rows[0]:
+                    columns.append((x,) + rows)
                 for i in range(wave.width):
                     _y = y + i
                     if (_y < self.height) and (_y >= 0):
@@ -85,13 +755,13 @@ class SurfBreak:
                                      (self.base_water_level - self.sea_floor[_y, x])) + 1
                                 )
                             # self.check_crashing()
-                            wave.coordinates.append((_y, x))
-
-            wave.step()
-
-        self.swell.step()
-
-        self.counter += 1
+                            wet_cells.append((_y, x))
+            band = EMPTY_BAND
+            if columns:
+                xs, y0, y1 = np.array(columns, dtype=np.intp).T
+                band = (int(xs[0]), y0, y1)
+            ys, xs = np.array(wet_cells, dtype=np.intp).reshape(-1, 2).T
+            wave.update_cells(band, (ys, xs))
 
     def add_wave(self, wave):
         self.swell.append(wave)
@@ -105,21 +775,118 @@ class Wave:
         Defines a wave within a surf break as a function of the time its been
         moving
         """
+        self.reset(height, width, angle, speed)
+
+    def reset(self, height, width, angle, speed):
+        """
+        Puts the wave back at the start of its path so it can be reused
+        :return: self
+        """
         self.height = height
         self.width = width
         self.angle = angle
         self.speed = speed
         self.counter = 0
-        self.coordinates = []
-        self.last_coordinates = []
+        # The cells of the band on the grid when it was last rasterized,
+        # and on the rasterization before that, see grid_bands
+        self.band = EMPTY_BAND
+        self.last_band = EMPTY_BAND
+        # The wet cells of band and last_band as y and x index arrays
+        self.wet_cells = EMPTY_CELLS
+        self.last_wet_cells = EMPTY_CELLS
+
+        return self
 
     def step(self):
         self.counter += 1
 
         return self
 
+    def update_cells(self, band, wet_cells):
+        """
+        Records the band and wet cells of a new rasterization, keeping the
+        previous ones as last_band and last_wet_cells
+        :return: None
+        """
+        self.last_band = self.band
+        self.last_wet_cells = self.wet_cells
+        self.band = band
+        self.wet_cells = wet_cells
+
+    @property
+    def coordinates(self):
+        """
+        The wet (y, x) cells of band as a list of tuples, built on every
+        access
+        """
+        ys, xs = self.wet_cells
+        return list(zip(ys.tolist(), xs.tolist()))
+
+    @property
+    def last_coordinates(self):
+        """
+        The wet (y, x) cells of last_band as a list of tuples
+        """
+        ys, xs = self.last_wet_cells
+        return list(zip(ys.tolist(), xs.tolist()))
+
+    def get_state(self):
+        """
+        Snapshot of the wave with copies of its bands and wet cells
+        :return: dict to pass to set_state
+        """
+        return {
+            'height': self.height,
+            'width': self.width,
+            'angle': self.angle,
+            'speed': self.speed,
+            'counter': self.counter,
+            'band': (self.band[0], self.band[1].copy(),
+                     self.band[2].copy()),
+            'last_band': (self.last_band[0], self.last_band[1].copy(),
+                          self.last_band[2].copy()),
+            'wet_cells': tuple(ix.copy() for ix in self.wet_cells),
+            'last_wet_cells': tuple(ix.copy() for ix in self.last_wet_cells)
+        }
+
+    def set_state(self, state):
+        """
+        Restores a snapshot from get_state
+        :return: self
+        """
+        self.reset(state['height'], state['width'], state['angle'],
+                   state['speed'])
+        self.counter = state['counter']
+        self.band = state['band']
+        self.last_band = state['last_band']
+        self.wet_cells = state['wet_cells']
+        self.last_wet_cells = state['last_wet_cells']
+
+        return self
+
+    def has_left(self, height, width):
+        """
+        Checks whether the band is off a height x width grid for good
+
+        The top row of the band is linear in x, so the extreme rows are at
+        the first and last column. The band has left once it is entirely
+        above the grid while moving up, or entirely below it while moving
+        down.
+        :return: bool
+        """
+        shift = self.counter * self.speed
+        tops = (int(-shift), int(self.angle * (width - 1) - shift))
+        if max(tops) + self.width <= 0:
+            return self.speed >= 0
+        if min(tops) >= height:
+            return self.speed <= 0
+        return False
+
 
 class Swell:
+    # Optional swell.envs.profiling.Profiler
+    profiler = None
+
     def __init__(self, period=100,
                  height=8,
                  width=16,
@@ -138,12 +905,80 @@ class Swell:
         self.waves = []
         self.counter = 0
 
+        # Waves that have left the break are kept here and recycled by
+        # generate_wave, so self.waves only holds the live ones
+        self.wave_pool = []
+        self.n_retired = 0
+
+    @property
+    def n_live(self):
+        return len(self.waves)
+
     def step(self):
+        if self.profiler is not None:
+            self.profiler.start('swell.step')
         if (self.counter % self.period) == 0:
             self.generate_wave()
         self.counter += 1
+        if self.profiler is not None:
+            self.profiler.stop()
 
     def generate_wave(self):
-        new_wave = Wave(self.height, self.width, self.angle, self.speed)
+        if self.wave_pool:
+            new_wave = self.wave_pool.pop().reset(self.height, self.width,
+                                                  self.angle, self.speed)
+        else:
+            new_wave = Wave(self.height, self.width, self.angle, self.speed)
         self.waves.append(new_wave)
 
+    def get_state(self):
+        """
+        Snapshot of the swell phase and its live waves, oldest first
+        :return: dict to pass to set_state
+        """
+        return {
+            'counter': self.counter,
+            'n_retired': self.n_retired,
+            'waves': [wave.get_state() for wave in self.waves]
+        }
+
+    def set_state(self, state):
+        """
+        Restores a snapshot from get_state, reusing Wave objects from the
+        pool where possible
+        :return: None
+        """
+        self.counter = state['counter']
+        self.n_retired = state['n_retired']
+        self.wave_pool.extend(self.waves)
+        self.waves = []
+        for wave_state in state['waves']:
+            if self.wave_pool:
+                wave = self.wave_pool.pop()
+            else:
+                wave = Wave.__new__(Wave)
+            self.waves.append(wave.set_state(wave_state))
+
+    def retire_waves(self, height, width):
+        """
+        Moves waves that have left a height x width break to the pool
+
+        A wave is only retired once its previous band was off the grid too,
+        so a renderer still gets one step to paint over its last band.
+        :return: number of waves retired
+        """
+        live = []
+        retired = []
+        for wave in self.waves:
+            if not len(wave.last_band[1]) and \
+                    wave.has_left(height, width):
+                retired.append(wave)
+            else:
+                live.append(wave)
+        if retired:
+            self.waves[:] = live
+            self.wave_pool.extend(retired)
+            self.n_retired += len(retired)
+
+        return len(retired)
+
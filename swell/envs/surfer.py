@@ -1,21 +1,34 @@
 import os
+import math
 import numpy as np
 from swell.envs.surf import SurfBreak
 
 
 class Surfer:
+    # Plain attributes and float speed components keep the per step work in
+    # Python scalars instead of tiny NumPy arrays
+    __slots__ = ('surfbreak', 'x', 'y', 'speed_y', 'speed_x', 'speed_buffer',
+                 'paddle_speed', 'turn_speed', 'wave_speed_const', 'max_speed', 'min_stoke',
+                 'action_space', 'mode', 'total_stoke', 'profiler')
+
     def __init__(self, surfbreak=None,
                  init_x=0,
                  init_y=0,
                  paddle_speed=1,
                  turn_speed=1,
-                 speed_init=np.array([0, 0]),
+                 speed_init=(0, 0),
                  wave_speed_const=10,
                  max_speed=10,
                  min_stoke=0.5):
         """
         Class that defines a surfer and how the surfer behaves in the surfbreak
+
+        The speed property is a writable [y, x] array, so in place writes
+        like surfer.speed[0] = 0 are kept. Steps work on two floats,
+        speed_y and speed_x, read from the array when a step starts and
+        written back when it ends.
         """
+        self.speed_buffer = np.zeros(2)
         if surfbreak is None:
             self.surfbreak = SurfBreak()
         else:
@@ -36,6 +49,54 @@ class Surfer:
 
         self.total_stoke = 0
 
+        # Optional swell.envs.profiling.Profiler
+        self.profiler = None
+
+    @property
+    def speed(self):
+        return self.speed_buffer
+
+    @speed.setter
+    def speed(self, speed):
+        self.speed_y = float(speed[0])
+        self.speed_x = float(speed[1])
+        self.store_speed()
+
+    def load_speed(self):
+        """
+        Reads speed_y and speed_x from the speed array
+        :return: None
+        """
+        self.speed_y, self.speed_x = self.speed_buffer.tolist()
+
+    def store_speed(self):
+        """
+        Writes speed_y and speed_x to the speed array
+        :return: None
+        """
+        self.speed_buffer[0] = self.speed_y
+        self.speed_buffer[1] = self.speed_x
+
+    def get_state(self):
+        """
+        Snapshot of the surfer's position, speed, mode and stoke
+        :return: dict to pass to set_state
+        """
+        return {
+            'y': self.y,
+            'x': self.x,
+            'speed': tuple(self.speed_buffer.tolist()),
+            'mode': self.mode,
+            'total_stoke': self.total_stoke
+        }
+
+    def set_state(self, state):
+        self.y = state['y']
+        self.x = state['x']
+        self.speed = state['speed']
+        self.mode = state['mode']
+        self.total_stoke = state['total_stoke']
+
     def step(self, actions):
         """
         Receives an action and moves the agent forward one step
@@ -53,29 +114,75 @@ class Surfer:
                - right, left
            - stand-up
         """
-        assert set(actions.keys()) == set(self.action_space)
+        assert actions.keys() == set(self.action_space)
+        if self.profiler is not None:
+            self.profiler.start('surfer.step')
+        if actions['change_mode'] == 1:
+            self.mode = 1 - self.mode
+        self.load_speed()
+        self._tick(actions)
+        self.store_speed()
+        if self.profiler is not None:
+            self.profiler.stop()
+
+    def step_n_frozen(self, actions, n_steps):
+        """
+        Repeats the same actions for n_steps steps against a frozen break,
+        see step. change_mode is a toggle, so it is only applied on the
+        first step.
+
+        The surfbreak is not stepped, so every step reads the same waves.
+        This is not n_steps environment steps; for those, step the break
+        between surfer steps, as SurfSesh does with frame_skip.
+        :return: the stoke summed over the steps
+        """
+        assert actions.keys() == set(self.action_space)
+        if n_steps < 1:
+            raise ValueError('n_steps should be at least 1.')
+        if self.profiler is not None:
+            self.profiler.start('surfer.step_n_frozen')
         if actions['change_mode'] == 1:
             self.mode = 1 - self.mode
+        self.load_speed()
+        stoke = 0
+        for _ in range(n_steps):
+            stoke += self._tick(actions)
+        self.store_speed()
+        if self.profiler is not None:
+            self.profiler.stop()
+        return stoke
+
+    def _tick(self, actions):
+        """
+        One step of step and step_n_frozen, after change_mode. Works on speed_y
+        and speed_x, see load_speed and store_speed.
+        :return: the stoke of the step
+        """
         self.update_speed(actions)
-        self.y = int(self.y + self.speed[0])
-        self.x = int(self.x + self.speed[1])
+        self.y = int(self.y + self.speed_y)
+        self.x = int(self.x + self.speed_x)
         self.check_edges()
-        self.total_stoke = self.total_stoke + self.get_stoke()
+        stoke = self.get_stoke()
+        self.total_stoke = self.total_stoke + stoke
+        return stoke
 
     def apply_water_friction(self, func=None):
         if func is not None:
-            self.speed = func(self.speed)
+            self.speed = func(np.array([self.speed_y, self.speed_x]))
         else:
-            self.speed = self.speed * self.surfbreak.water_friction_coef
+            coef = self.surfbreak.water_friction_coef
+            self.speed_y = self.speed_y * coef
+            self.speed_x = self.speed_x * coef
 
     def update_speed(self, actions):
         # Can eventually add turtle-tuck
         if self.mode == 0:
-            delta_speed = self.paddle(up=actions['up'],
-                                      down=actions['down'],
-                                      left=actions['left'],
-                                      right=actions['right'])
-            self.speed = self.speed + delta_speed
+            delta_y, delta_x = self.paddle_delta(up=actions['up'],
+                                                 down=actions['down'],
+                                                 left=actions['left'],
+                                                 right=actions['right'])
+            self.speed_y = self.speed_y + delta_y
+            self.speed_x = self.speed_x + delta_x
         # elif self.mode == 1:
         #     # right = turn clockwise, left = turn counterclockwise
         #     if actions['right'] or actions['left']:
@@ -83,21 +190,28 @@ class Surfer:
         #                                right=actions['right'],
         #                                left=actions['left'])
 
-        self.speed = self.speed + self.get_wave_speed()
+        wave_speed_y, wave_speed_x = self.wave_speed()
+        self.speed_y = self.speed_y + wave_speed_y
+        self.speed_x = self.speed_x + wave_speed_x
         self.apply_water_friction()
 
-    def paddle(self, up=False, down=False, left=False, right=False):
-        paddle = np.array([0, 0])
+    def paddle_delta(self, up=False, down=False, left=False, right=False):
+        """
+        Speed change from paddling as a (y, x) tuple
+        """
         if up:
-            paddle += np.array([-1, 0])
+            return -self.paddle_speed, 0
         elif right:
-            paddle += np.array([0, 1])
+            return 0, self.paddle_speed
         elif down:
-            paddle += np.array([1, 0])
+            return self.paddle_speed, 0
         elif left:
-            paddle += np.array([0, -1])
+            return 0, -self.paddle_speed
+        return 0, 0
 
-        return paddle * self.paddle_speed
+    def paddle(self, up=False, down=False, left=False, right=False):
+        return np.array(self.paddle_delta(up=up, down=down, left=left,
+                                          right=right))
 
     def turn(self, speed, right=False, left=False):
 
@@ -118,24 +232,54 @@ class Surfer:
 
         return speed
 
-    def get_wave_speed(self):
+    def wave_speed(self):
         """
         Gets additive wave speed based on position on wave
-        :return: speed
+        :return: (y, x) tuple of floats
         """
-        wave_speed = np.array([0.0, 0.0])
+        if self.surfbreak.lazy_frame is not None:
+            return self.lazy_wave_speed()
+        crashing = self.surfbreak.crashing
         if self.y == 0 or self.y == (self.surfbreak.height - 1):
-            wave_speed[0] = 0
+            wave_speed_y = 0.0
         else:
-            wave_speed[0] = self.surfbreak.crashing[self.y - 1, self.x] - \
-                            self.surfbreak.crashing[self.y + 1, self.x]
+            wave_speed_y = crashing.item(self.y - 1, self.x) - \
+                           crashing.item(self.y + 1, self.x)
         if self.x == 0 or self.x == (self.surfbreak.width - 1):
-            wave_speed[1] = 0
+            wave_speed_x = 0.0
         else:
-            wave_speed[1] = self.surfbreak.crashing[self.y, self.x - 1] - \
-                            self.surfbreak.crashing[self.y, self.x + 1]
+            wave_speed_x = crashing.item(self.y, self.x - 1) - \
+                           crashing.item(self.y, self.x + 1)
 
-        return wave_speed * self.wave_speed_const
+        return (wave_speed_y * self.wave_speed_const,
+                wave_speed_x * self.wave_speed_const)
+
+    def lazy_wave_speed(self):
+        """
+        wave_speed from point queries, so a lazy surfbreak is not rasterized
+        :return: (y, x) tuple of floats
+        """
+        ys = [self.y - 1, self.y + 1, self.y, self.y]
+        xs = [self.x, self.x, self.x - 1, self.x + 1]
+        inside_y = 0 < self.y < self.surfbreak.height - 1
+        inside_x = 0 < self.x < self.surfbreak.width - 1
+        if not inside_y:
+            ys[:2] = [self.y, self.y]
+        if not inside_x:
+            xs[2:] = [self.x, self.x]
+        up, down, left, right = self.surfbreak.crashing_at(ys, xs).tolist()
+        wave_speed_y = up - down if inside_y else 0.0
+        wave_speed_x = left - right if inside_x else 0.0
+
+        return (wave_speed_y * self.wave_speed_const,
+                wave_speed_x * self.wave_speed_const)
+
+    def get_wave_speed(self):
+        """
+        Gets additive wave speed based on position on wave
+        :return: speed
+        """
+        return np.array(self.wave_speed())
 
     def check_edges(self):
         if self.x < 0:
@@ -158,7 +302,186 @@ class Surfer:
         surfer is standing up, at each step.
         '''
 
-        stoke = np.sqrt(np.sum(np.square(self.speed))) * self.mode
+        stoke = math.sqrt(self.speed_y * self.speed_y +
+                          self.speed_x * self.speed_x) * self.mode
         if stoke < self.min_stoke:
             stoke = 0
         return stoke
+
+
+class SurferBatch:
+    def __init__(self, surfbreak,
+                 n_surfers=None,
+                 paddle_speed=1,
+                 turn_speed=1,
+                 wave_speed_const=10,
+                 max_speed=10,
+                 min_stoke=0.5):
+        """
+        Many surfers stored as arrays and stepped together
+
+        Applies the same kinematics as Surfer to every surfer at once. The
+        surfbreak is either a SurfBreak that all surfers share, or a
+        BatchedSurfBreak with surfer i in break i.
+        """
+        self.surfbreak = surfbreak
+        if n_surfers is None:
+            n_surfers = surfbreak.n_envs
+        self.n_surfers = n_surfers
+        self.y = np.zeros(n_surfers, dtype=np.intp)
+        self.x = np.zeros(n_surfers, dtype=np.intp)
+        self.speed = np.zeros((n_surfers, 2))
+        self.paddle_speed = paddle_speed
+        self.turn_speed = turn_speed
+        self.wave_speed_const = wave_speed_const
+        self.max_speed = max_speed
+        self.min_stoke = min_stoke
+
+        self.action_space = ['up', 'down', 'left', 'right', 'change_mode']
+
+        # 0 for paddle mode, 1 for standing up
+        self.mode = np.zeros(n_surfers, dtype=np.intp)
+
+        self.total_stoke = np.zeros(n_surfers)
+
+    def __len__(self):
+        return self.n_surfers
+
+    def __getitem__(self, surfer_ix):
+        return SurferView(self, surfer_ix)
+
+    def step(self, actions):
+        """
+        Moves every surfer forward one step, see Surfer.step
+        :param actions: (n_surfers, len(action_space)) array of 0/1 values
+            in action_space order
+        :return: None
+        """
+        actions = np.asarray(actions)
+        assert actions.shape == (self.n_surfers, len(self.action_space))
+        self.mode = np.where(actions[:, 4] == 1, 1 - self.mode, self.mode)
+        self.update_speed(actions)
+        self.y = (self.y + self.speed[:, 0]).astype(np.intp)
+        self.x = (self.x + self.speed[:, 1]).astype(np.intp)
+        self.check_edges()
+        self.total_stoke = self.total_stoke + self.get_stoke()
+
+    def update_speed(self, actions):
+        paddling = (self.mode == 0)[:, None]
+        self.speed = self.speed + self.paddle(actions) * paddling
+        self.speed = self.speed + self.get_wave_speed()
+        coef = np.asarray(self.surfbreak.water_friction_coef)
+        if coef.ndim:
+            coef = coef[:, None]
+        self.speed = self.speed * coef
+
+    def paddle(self, actions):
+        """
+        Paddle direction of every surfer. As in Surfer.paddle only the first
+        pressed of up, right, down and left counts.
+        :return: (n_surfers, 2) array
+        """
+        up, down, left, right = (actions[:, i] != 0 for i in range(4))
+        right = right & ~up
+        down = down & ~(up | right)
+        left = left & ~(up | right | down)
+        paddle = np.zeros((self.n_surfers, 2), dtype=np.intp)
+        paddle[:, 0] = down.astype(np.intp) - up
+        paddle[:, 1] = right.astype(np.intp) - left
+
+        return paddle * self.paddle_speed
+
+    def crashing_at(self, ys, xs):
+        """
+        Gathers crashing values at one cell per surfer
+        :return: (n_surfers,) array
+        """
+        if self.surfbreak.lazy:
+            return self.surfbreak.crashing_at(ys, xs)
+        crashing = self.surfbreak.crashing
+        if crashing.ndim == 3:
+            return crashing[np.arange(self.n_surfers), ys, xs]
+        return crashing[ys, xs]
+
+    def get_wave_speed(self):
+        """
+        Gets additive wave speed of every surfer, see Surfer.get_wave_speed
+        :return: (n_surfers, 2) array
+        """
+        height = self.surfbreak.height
+        width = self.surfbreak.width
+        inside_y = (self.y > 0) & (self.y < height - 1)
+        inside_x = (self.x > 0) & (self.x < width - 1)
+        up = np.clip(self.y - 1, 0, height - 1)
+        down = np.clip(self.y + 1, 0, height - 1)
+        left = np.clip(self.x - 1, 0, width - 1)
+        right = np.clip(self.x + 1, 0, width - 1)
+
+        wave_speed = np.zeros((self.n_surfers, 2))
+        wave_speed[:, 0] = np.where(
+            inside_y,
+            self.crashing_at(up, self.x) - self.crashing_at(down, self.x),
+            0
+        )
+        wave_speed[:, 1] = np.where(
+            inside_x,
+            self.crashing_at(self.y, left) - self.crashing_at(self.y, right),
+            0
+        )
+
+        return wave_speed * self.wave_speed_const
+
+    def check_edges(self):
+        height = self.surfbreak.height
+        width = self.surfbreak.width
+        self.x = np.where(self.x < 0, 0, self.x)
+        self.x = np.where(self.x >= width, width - 2, self.x)
+        self.y = np.where(self.y < 0, 0, self.y)
+        self.y = np.where(self.y >= height, height - 2, self.y)
+
+    def get_stoke(self):
+        """
+        Per step reward of every surfer, see Surfer.get_stoke
+        :return: (n_surfers,) array
+        """
+        stoke = np.sqrt(np.sum(np.square(self.speed), axis=1)) * self.mode
+        stoke[stoke < self.min_stoke] = 0
+        return stoke
+
+
+class SurferView:
+    def __init__(self, batch, surfer_ix):
+        """
+        One surfer of a SurferBatch, with the attributes of a Surfer
+
+        Reads go to the batch arrays, so the view follows the batch as it
+        steps. surfbreak is the break the surfer is in.
+        """
+        self.batch = batch
+        self.surfer_ix = surfer_ix
+        self.max_speed = batch.max_speed
+        self.action_space = batch.action_space
+        if hasattr(batch.surfbreak, 'n_envs'):
+            self.surfbreak = batch.surfbreak[surfer_ix]
+        else:
+            self.surfbreak = batch.surfbreak
+
+    @property
+    def y(self):
+        return int(self.batch.y[self.surfer_ix])
+
+    @property
+    def x(self):
+        return int(self.batch.x[self.surfer_ix])
+
+    @property
+    def speed(self):
+        return self.batch.speed[self.surfer_ix]
+
+    @property
+    def mode(self):
+        return int(self.batch.mode[self.surfer_ix])
+
+    @property
+    def total_stoke(self):
+        return self.batch.total_stoke[self.surfer_ix]
@@ -0,0 +1,168 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from gym import spaces
+from stable_baselines3.common.vec_env.base_vec_env import VecEnv
+
+
+class ThreadVecEnv(VecEnv):
+    def __init__(self, env_fns, n_workers=None):
+        """
+        Thread pool VecEnv for SurfSesh
+
+        The environments live in this process and are stepped by a pool of
+        threads, each taking an even share of them. The wave rasterization
+        in SurfBreak.step is NumPy work that releases the GIL, so the
+        threads overlap on several cores without the processes and pickling
+        of SubprocVecEnv.
+
+        Each thread writes its observations straight into preallocated
+        (n_envs, ...) buffers, one per observation key, in the dtype of the
+        observation space. The observations returned by reset and step_wait
+        are those buffers: they are overwritten by the next step, so copy
+        them if they need to outlive it.
+
+        step_async and step_wait follow the VecEnv interface. In asyncio
+        code, await astep(actions) and areset() instead.
+
+        :param env_fns: functions that build each environment
+        :param n_workers: number of threads, defaults to one per environment
+            capped at the number of CPUs
+        """
+        self.envs = [env_fn() for env_fn in env_fns]
+        n_envs = len(self.envs)
+        if n_workers is None:
+            n_workers = min(n_envs, os.cpu_count() or 1)
+        env = self.envs[0]
+        VecEnv.__init__(self, n_envs, env.observation_space, env.action_space)
+
+        self.env_ix = [ix for ix in np.array_split(np.arange(n_envs), n_workers)
+                       if len(ix)]
+        self.pool = ThreadPoolExecutor(max_workers=len(self.env_ix))
+
+        if isinstance(self.observation_space, spaces.Dict):
+            obs_spaces = self.observation_space.spaces
+        else:
+            obs_spaces = {None: self.observation_space}
+        self.buffers = {
+            key: np.zeros((n_envs,) + space.shape, dtype=space.dtype)
+            for key, space in obs_spaces.items()
+        }
+        self.rewards = np.zeros(n_envs)
+        self.dones = np.zeros(n_envs, dtype=bool)
+        self.infos = [{} for _ in range(n_envs)]
+        self.futures = []
+        self.closed = False
+
+    def _write(self, i, obs):
+        if None in self.buffers:
+            self.buffers[None][i] = obs
+        else:
+            for key, buffer in self.buffers.items():
+                buffer[i] = obs[key]
+
+    def _step_envs(self, env_ix, actions):
+        for i in env_ix:
+            obs, self.rewards[i], self.dones[i], info = \
+                self.envs[i].step(actions[i])
+            if self.dones[i]:
+                if None in self.buffers:
+                    info['terminal_observation'] = np.array(obs)
+                else:
+                    info['terminal_observation'] = {
+                        key: np.array(value) for key, value in obs.items()
+                    }
+                obs = self.envs[i].reset()
+            self._write(i, obs)
+            self.infos[i] = info
+
+    def _reset_envs(self, env_ix):
+        for i in env_ix:
+            self._write(i, self.envs[i].reset())
+
+    def _get_obs(self):
+        if None in self.buffers:
+            return self.buffers[None]
+        return dict(self.buffers)
+
+    def _results(self):
+        return self._get_obs(), self.rewards.copy(), self.dones.copy(), \
+            list(self.infos)
+
+    def step_async(self, actions):
+        actions = np.asarray(actions)
+        self.futures = [self.pool.submit(self._step_envs, env_ix, actions)
+                        for env_ix in self.env_ix]
+
+    def step_wait(self):
+        for future in self.futures:
+            future.result()
+        self.futures = []
+        return self._results()
+
+    def reset(self):
+        for future in [self.pool.submit(self._reset_envs, env_ix)
+                       for env_ix in self.env_ix]:
+            future.result()
+        return self._get_obs()
+
+    async def astep(self, actions):
+        """
+        step for asyncio code, the event loop keeps running while the
+        threads step the environments
+        :return: observations, rewards, dones, infos
+        """
+        self.step_async(actions)
+        futures, self.futures = self.futures, []
+        await asyncio.gather(*[asyncio.wrap_future(future)
+                               for future in futures])
+        return self._results()
+
+    async def areset(self):
+        """
+        reset for asyncio code
+        :return: observations
+        """
+        await asyncio.gather(*[
+            asyncio.wrap_future(self.pool.submit(self._reset_envs, env_ix))
+            for env_ix in self.env_ix
+        ])
+        return self._get_obs()
+
+    def seed(self, seed=None):
+        if seed is None:
+            seed = np.random.randint(0, 2 ** 32 - 1)
+        return [env.seed(seed + i) if hasattr(env, 'seed') else None
+                for i, env in enumerate(self.envs)]
+
+    def close(self):
+        if self.closed:
+            return
+        for future in self.futures:
+            future.result()
+        self.pool.shutdown()
+        for env in self.envs:
+            env.close()
+        self.closed = True
+
+    def get_attr(self, attr_name, indices=None):
+        return [getattr(self.envs[i], attr_name)
+                for i in self._get_indices(indices)]
+
+    def set_attr(self, attr_name, value, indices=None):
+        for i in self._get_indices(indices):
+            setattr(self.envs[i], attr_name, value)
+
+    def env_method(self, method_name, *method_args, indices=None,
+                   **method_kwargs):
+        return [getattr(self.envs[i], method_name)(*method_args,
+                                                   **method_kwargs)
+                for i in self._get_indices(indices)]
+
+    def env_is_wrapped(self, wrapper_class, indices=None):
+        # Import here to avoid a circular import
+        from stable_baselines3.common.env_util import is_wrapped
+
+        return [is_wrapped(self.envs[i], wrapper_class)
+                for i in self._get_indices(indices)]
@@ -0,0 +1,226 @@
+import numpy as np
+'''
+Tiled storage for the grids of very large breaks
+
+A TiledGrid splits a grid into tile_size x tile_size tiles. Only the tiles
+that have been written to are stored; every other tile holds the fill
+value and is represented by one shared read-only tile. SurfBreak with
+tile_size keeps active_water_level and crashing this way, so each step
+only allocates and writes the tiles the wave bands run through.
+
+TiledGrid supports the reads the rest of the package does on a grid:
+item, indexing with integer arrays or slices and np.asarray, which
+assembles the dense grid. Prefer tile and blocks, which hand out views of
+the stored tiles without assembling anything.
+'''
+
+
+class TiledGrid:
+    def __init__(self, height, width, tile_size=64, fill=0,
+                 dtype=np.float64):
+        """
+        A height x width grid stored as tile_size x tile_size tiles, all
+        holding fill until tiles are allocated
+        """
+        self.shape = (height, width)
+        self.ndim = 2
+        self.dtype = np.dtype(dtype)
+        self.tile_size = tile_size
+        self.tiles_shape = (-(-height // tile_size), -(-width // tile_size))
+        # Position of every tile in tiles, -1 for tiles that are all fill
+        self.tile_ix = np.full(self.tiles_shape, -1, dtype=np.intp)
+        # Grows as needed and is reused, tiles is a view of its start
+        self.buffer = np.zeros((0, tile_size, tile_size), dtype=self.dtype)
+        self.tiles = self.buffer
+        self.fill = fill
+        self.fill_tile = np.full((tile_size, tile_size), fill,
+                                 dtype=self.dtype)
+        self.fill_tile.flags.writeable = False
+
+    @property
+    def size(self):
+        return self.shape[0] * self.shape[1]
+
+    @property
+    def nbytes(self):
+        return self.tiles.nbytes + self.tile_ix.nbytes
+
+    @property
+    def n_tiles(self):
+        """
+        Number of stored tiles
+        """
+        return len(self.tiles)
+
+    def clear(self, fill):
+        """
+        Drops every stored tile, so the whole grid holds fill
+        :return: None
+        """
+        self.tile_ix.fill(-1)
+        self.tiles = self.buffer[:0]
+        if fill != self.fill:
+            self.fill = fill
+            self.fill_tile = np.full(self.fill_tile.shape, fill,
+                                     dtype=self.dtype)
+            self.fill_tile.flags.writeable = False
+
+    def allocate(self, touched):
+        """
+        Stores the tiles marked in touched, a tiles_shape bool array, and
+        fills them with the fill value. Call clear first.
+        :return: None
+        """
+        tile_ys, tile_xs = np.nonzero(touched)
+        n_tiles = len(tile_ys)
+        if n_tiles > len(self.buffer):
+            self.buffer = np.empty((max(n_tiles, 2 * len(self.buffer)),) +
+                                   self.fill_tile.shape, dtype=self.dtype)
+        self.tiles = self.buffer[:n_tiles]
+        self.tiles.fill(self.fill)
+        self.tile_ix[tile_ys, tile_xs] = np.arange(n_tiles)
+
+    def local(self, ys, xs):
+        """
+        Index of cells (ys, xs) into tiles, the tile index is -1 for cells
+        of tiles that are not stored
+        :return: tile, row and column index arrays
+        """
+        tile_size = self.tile_size
+        return (self.tile_ix[ys // tile_size, xs // tile_size],
+                ys % tile_size, xs % tile_size)
+
+    def tile(self, tile_y, tile_x):
+        """
+        The tile at tile row tile_y and column tile_x: a view of the stored
+        tile, or the shared read-only fill tile. Tiles on the bottom and
+        right edges extend past the grid.
+        :return: (tile_size, tile_size) array
+        """
+        ix = self.tile_ix[tile_y, tile_x]
+        if ix < 0:
+            return self.fill_tile
+        return self.tiles[ix]
+
+    def blocks(self, y0=0, y1=None, x0=0, x1=None):
+        """
+        Yields the parts of the tiles covering rows y0 to y1 and columns x0
+        to x1, as (y, x, block) with block a view of a tile whose top left
+        cell is (y, x)
+        """
+        height, width = self.shape
+        y1 = height if y1 is None else y1
+        x1 = width if x1 is None else x1
+        tile_size = self.tile_size
+        for tile_y in range(y0 // tile_size, -(-y1 // tile_size)):
+            top = tile_y * tile_size
+            rows = slice(max(y0 - top, 0), min(y1 - top, tile_size))
+            for tile_x in range(x0 // tile_size, -(-x1 // tile_size)):
+                left = tile_x * tile_size
+                columns = slice(max(x0 - left, 0), min(x1 - left, tile_size))
+                yield (top + rows.start, left + columns.start,
+                       self.tile(tile_y, tile_x)[rows, columns])
+
+    def window(self, y0, y1, x0, x1):
+        """
+        Dense copy of rows y0 to y1 and columns x0 to x1, assembled from
+        the tiles they cover
+        :return: (y1 - y0, x1 - x0) array
+        """
+        out = np.empty((y1 - y0, x1 - x0), dtype=self.dtype)
+        for y, x, block in self.blocks(y0, y1, x0, x1):
+            out[y - y0:y - y0 + block.shape[0],
+                x - x0:x - x0 + block.shape[1]] = block
+        return out
+
+    def gather(self, ys, xs):
+        """
+        Values at cells (ys, xs)
+        :return: array with the broadcast shape of ys and xs
+        """
+        ys, xs = np.broadcast_arrays(np.asarray(ys, dtype=np.intp),
+                                     np.asarray(xs, dtype=np.intp))
+        tile_ix, rows, columns = self.local(ys, xs)
+        values = np.full(ys.shape, self.fill, dtype=self.dtype)
+        stored = tile_ix >= 0
+        values[stored] = self.tiles[tile_ix[stored], rows[stored],
+                                    columns[stored]]
+        return values
+
+    def item(self, y, x):
+        tile_size = self.tile_size
+        ix = self.tile_ix[y // tile_size, x // tile_size]
+        if ix < 0:
+            return self.fill_tile.item(0, 0)
+        return self.tiles.item(ix, y % tile_size, x % tile_size)
+
+    def __getitem__(self, key):
+        ys, xs = key
+        if isinstance(ys, slice) and isinstance(xs, slice):
+            rows = range(*ys.indices(self.shape[0]))
+            columns = range(*xs.indices(self.shape[1]))
+            if rows.step == 1 and columns.step == 1:
+                return self.window(rows.start, max(rows.stop, rows.start),
+                                   columns.start,
+                                   max(columns.stop, columns.start))
+            return self.gather(np.array(rows)[:, None], np.array(columns))
+        if isinstance(ys, slice):
+            ys = np.arange(*ys.indices(self.shape[0]))
+        if isinstance(xs, slice):
+            xs = np.arange(*xs.indices(self.shape[1]))
+        if np.ndim(ys) == 0 and np.ndim(xs) == 0:
+            return self.dtype.type(self.item(int(ys), int(xs)))
+        return self.gather(ys, xs)
+
+    def __array__(self, dtype=None, copy=None):
+        grid = self.window(0, self.shape[0], 0, self.shape[1])
+        if dtype is not None:
+            grid = grid.astype(dtype, copy=False)
+        return grid
+
+    def copy(self):
+        """
+        Copy that only holds the stored tiles
+        :return: TiledGrid
+        """
+        grid = TiledGrid.__new__(TiledGrid)
+        grid.__dict__.update(self.__dict__)
+        grid.tile_ix = self.tile_ix.copy()
+        grid.buffer = grid.tiles = self.tiles.copy()
+        return grid
+
+    def assign(self, other):
+        """
+        Copies the tiles of another TiledGrid of the same layout into this
+        one, reusing its buffer
+        :return: None
+        """
+        self.clear(other.fill)
+        self.allocate(other.tile_ix >= 0)
+        self.tiles[self.tile_ix[other.tile_ix >= 0]] = \
+            other.tiles[other.tile_ix[other.tile_ix >= 0]]
+
+
+def band_tiles(tops, widths, height, tile_size):
+    """
+    Tiles that wave bands run through on a grid height rows tall
+
+    :param tops: (waves, width) array from swell.envs.surf.band_tops
+    :param widths: (waves,) band widths
+    :return: bool array with one entry per tile
+    """
+    width = tops.shape[1]
+    touched = np.zeros((-(-height // tile_size), -(-width // tile_size)),
+                       dtype=bool)
+    y0 = np.maximum(tops, 0)
+    y1 = np.minimum(tops + widths[:, None], height)
+    wave_ix, xs = np.nonzero(y1 > y0)
+    first = y0[wave_ix, xs] // tile_size
+    last = (y1[wave_ix, xs] - 1) // tile_size
+    tile_xs = xs // tile_size
+    # A band spans a few tile rows per column at most
+    for k in range(int((last - first).max(initial=-1)) + 1):
+        more = first + k <= last
+        touched[first[more] + k, tile_xs[more]] = True
+
+    return touched
@@ -0,0 +1,114 @@
+import numpy as np
+from gym import spaces
+from stable_baselines3.common.vec_env import VecEnv
+from swell.envs.batched import BatchedSurfBreak
+from swell.envs.observation import surf_observation_space
+from swell.envs.surfer import SurferBatch
+
+
+class VectorSurfSesh(VecEnv):
+    def __init__(self, n_envs=1, surfers=None, max_timesteps=1000):
+        """
+        n_envs SurfSesh environments stepped as one batch
+
+        Implements the stable-baselines3 VecEnv interface natively: the
+        breaks live in one BatchedSurfBreak and the surfers in one
+        SurferBatch, so a step is a fixed number of array operations instead
+        of n_envs calls to SurfSesh.step. Observations are stacked dicts
+        with a leading env axis and environments reset automatically when
+        they are done, with the last observation in
+        info['terminal_observation']. Like SurfSesh.reset, resetting puts
+        the break back in its initial state.
+
+        surfers is a SurferBatch on a BatchedSurfBreak; by default one is
+        built with the default break and surfer settings.
+        """
+        if surfers is None:
+            surfers = SurferBatch(BatchedSurfBreak(n_envs=n_envs))
+        self.surfers = surfers
+        self.surfbreak = surfers.surfbreak
+        self.max_timesteps = max_timesteps
+
+        observation_space = surf_observation_space(self.surfbreak,
+                                                   self.surfers.max_speed)
+        action_space = spaces.MultiBinary(n=len(self.surfers.action_space))
+        super(VectorSurfSesh, self).__init__(self.surfbreak.n_envs,
+                                             observation_space,
+                                             action_space)
+
+        self.actions = None
+        self.rng = np.random.RandomState()
+
+    def _get_obs(self):
+        return {
+            'active_water_level': self.surfbreak.active_water_level.copy(),
+            'crashing': self.surfbreak.crashing.copy(),
+            'position': np.stack([self.surfers.y, self.surfers.x], axis=1),
+            'speed': self.surfers.speed.copy()
+        }
+
+    def _reset_envs(self, env_ix):
+        self.surfbreak.reset_envs(env_ix)
+        n = len(env_ix)
+        self.surfers.y[env_ix] = (self.rng.rand(n) *
+                                  self.surfbreak.height).astype(np.intp)
+        self.surfers.x[env_ix] = (self.rng.rand(n) *
+                                  self.surfbreak.width).astype(np.intp)
+        self.surfers.speed[env_ix] = 0
+        self.surfers.mode[env_ix] = 0
+        self.surfers.total_stoke[env_ix] = 0
+
+    def reset(self):
+        self._reset_envs(np.arange(self.num_envs))
+        return self._get_obs()
+
+    def step_async(self, actions):
+        self.actions = np.asarray(actions)
+
+    def step_wait(self):
+        self.surfbreak.step()
+        self.surfers.step(self.actions)
+
+        obs = self._get_obs()
+        rewards = self.surfers.get_stoke()
+        dones = self.surfbreak.counter > self.max_timesteps
+        infos = [{} for _ in range(self.num_envs)]
+
+        done_ix = np.flatnonzero(dones)
+        if len(done_ix):
+            for i in done_ix:
+                infos[i]['terminal_observation'] = {
+                    key: value[i].copy() for key, value in obs.items()
+                }
+            self._reset_envs(done_ix)
+            obs['active_water_level'][done_ix] = \
+                self.surfbreak.active_water_level[done_ix]
+            obs['crashing'][done_ix] = self.surfbreak.crashing[done_ix]
+            obs['position'][done_ix, 0] = self.surfers.y[done_ix]
+            obs['position'][done_ix, 1] = self.surfers.x[done_ix]
+            obs['speed'][done_ix] = self.surfers.speed[done_ix]
+
+        return obs, rewards, dones, infos
+
+    def seed(self, seed=None):
+        self.rng = np.random.RandomState(seed)
+        return [seed] * self.num_envs
+
+    def close(self):
+        pass
+
+    def get_attr(self, attr_name, indices=None):
+        value = getattr(self, attr_name)
+        return [value for _ in self._get_indices(indices)]
+
+    def set_attr(self, attr_name, value, indices=None):
+        setattr(self, attr_name, value)
+
+    def env_method(self, method_name, *method_args, indices=None,
+                   **method_kwargs):
+        method = getattr(self, method_name)
+        return [method(*method_args, **method_kwargs)
+                for _ in self._get_indices(indices)]
+
+    def env_is_wrapped(self, wrapper_class, indices=None):
+        return [False for _ in self._get_indices(indices)]
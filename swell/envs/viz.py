@@ -1,71 +1,134 @@
 import os
-import seaborn as sns
-from pygame import Surface, PixelArray, Color, image, transform
-
-WAVE_MAX_HEIGHT = 20
-SEAFLOOR_MIN_HEIGHT = -20
-SEA_COLOR_PALETTE = sns.color_palette('Blues', n_colors=80)[40:]
-for ix, color in enumerate(SEA_COLOR_PALETTE):
-    r, g, b = int(255 * color[0]), int(255 * color[1]), int(255 * color[2])
-    SEA_COLOR_PALETTE[ix] = (r, g, b)
-CRASH_COLOR = (255, 255, 255)
-BEACH_COLOR = (230, 207, 138)
-WAVE_BREAK_RATIO = 2
+import numpy as np
+from pygame import Surface, Rect, image, transform, surfarray
+from swell.envs.surf import band_cells
+from swell.envs.palette import WAVE_MAX_HEIGHT, SEAFLOOR_MIN_HEIGHT, \
+    SEA_COLOR_PALETTE, CRASH_COLOR, BEACH_COLOR, WAVE_BREAK_RATIO, \
+    SEA_COLOR_LUT, CRASH_RGB, BEACH_RGB
 
 '''
 TO-DO: Make Viz class that encompasses both surfbreak viz and surfer viz
 '''
 
+def map_to_rgb_array(surfbreak, ys=None, xs=None):
+    """
+    Vectorized map_to_rgb for the cells (ys, xs) of surfbreak
+    :return: (len(ys), 3) uint8 array, or the whole (height, width, 3)
+        frame when no cells are given
+    """
+    if ys is None:
+        water_level = surfbreak.active_water_level
+        crashing = surfbreak.crashing
+        sea_floor = surfbreak.sea_floor
+    else:
+        water_level = surfbreak.active_water_level[ys, xs]
+        crashing = surfbreak.crashing[ys, xs]
+        sea_floor = surfbreak.sea_floor[ys, xs]
+
+    return grid_to_rgb(water_level, crashing, sea_floor,
+                       surfbreak.base_water_level)
+
+
+def grid_to_rgb(water_level, crashing, sea_floor, base_water_level):
+    """
+    Colors of cells given their water level, crashing and sea floor arrays
+    :return: uint8 array with a trailing axis of 3
+    """
+    ix = water_level.astype(np.intp) - SEAFLOOR_MIN_HEIGHT
+    np.clip(ix, 0, len(SEA_COLOR_LUT) - 1, out=ix)
+    rgb = SEA_COLOR_LUT[ix]
+    rgb[crashing > WAVE_BREAK_RATIO] = CRASH_RGB
+    rgb[base_water_level <= sea_floor] = BEACH_RGB
+
+    return rgb
+
+
 class SurfBreakViz:
-    def __init__(self, surfbreak):
+    # Optional swell.envs.profiling.Profiler
+    profiler = None
+
+    def __init__(self, surfbreak, dirty_updates=True):
+        """
+        Draws a surfbreak onto a persistent pygame Surface
+
+        Colors come from NumPy lookup tables. With dirty_updates, get_image
+        only repaints the cells of the wave bands, like the original pixel
+        loop did, and dirty_rects holds the rectangles that changed, ready
+        for pygame.display.update. Otherwise, and for lazy surfbreaks, which
+        do not track wave bands, every frame is redrawn in full. Tiled
+        surfbreaks are drawn tile by tile, without assembling their grids.
+        """
         self.surfbreak = surfbreak
+        self.dirty_updates = dirty_updates
+        self.dirty_rects = []
 
         self.surface = Surface((surfbreak.width, surfbreak.height))
         self.init_image()
 
     def step(self):
         self.surfbreak.step()
+        if self.profiler is not None:
+            self.profiler.start('viz.get_image')
         self.get_image()
+        if self.profiler is not None:
+            self.profiler.stop()
 
     def init_image(self):
         """
-        Transforms from a Surfbreak object to the rgb pixel color space
-        :param surfbreak: the image that will be transformed
-        :return: image - the image transformed into the rgb pixel space
+        Draws the whole surfbreak
+        :return: the updated surface
         """
-        # image = list(self.image)
-        pixel_array = PixelArray(self.surface)
-        for y in range(self.surfbreak.height):
-            for x in range(self.surfbreak.width):
-                if self.surfbreak.base_water_level <= self.surfbreak.sea_floor[y, x]:
-                    rgb = BEACH_COLOR
-                elif self.surfbreak.crashing[y, x] > WAVE_BREAK_RATIO:
-                    rgb = CRASH_COLOR
-                else:
-                    rgb = SEA_COLOR_PALETTE[int(self.surfbreak.active_water_level[y, x])
-                                            - SEAFLOOR_MIN_HEIGHT]
-
-                pixel_array[x, y] = Color(rgb)
-
-        self.surface = pixel_array.make_surface()
-        pixel_array.close()
+        surfbreak = self.surfbreak
+        if surfbreak.tile_size is None:
+            frame = map_to_rgb_array(surfbreak)
+            surfarray.blit_array(self.surface, frame.swapaxes(0, 1))
+        else:
+            pixels = surfarray.pixels3d(self.surface)
+            for (y, x, water_level), (_, _, crashing) in zip(
+                    surfbreak.active_water_level.blocks(),
+                    surfbreak.crashing.blocks()):
+                height, width = water_level.shape
+                rgb = grid_to_rgb(water_level, crashing,
+                                  surfbreak.sea_floor[y:y + height,
+                                                      x:x + width],
+                                  surfbreak.base_water_level)
+                pixels[x:x + width, y:y + height] = rgb.swapaxes(0, 1)
+            # Unlock the surface
+            del pixels
+        self.dirty_rects = [self.surface.get_rect()]
 
         return self.surface
 
     def get_image(self):
-        # image = list(self.image)
-        # We update where the wave was and where it is now
-        pixel_array = PixelArray(self.surface)
-        for wave in self.surfbreak.swell.waves:
-            for (y, x) in wave.coordinates:
-                rgb = self.map_to_rgb(y, x)
-                pixel_array[x, y] = Color(rgb)
-            for (y, x) in wave.last_coordinates:
-                rgb = self.map_to_rgb(y, x)
-                pixel_array[x, y] = Color(rgb)
-
-        self.surface = pixel_array.make_surface()
-        pixel_array.close()
+        """
+        Redraws the cells where the waves were and where they are now
+        :return: the updated surface
+        """
+        if not self.dirty_updates or self.surfbreak.lazy:
+            return self.init_image()
+
+        self.dirty_rects = []
+        bands = [band for wave in self.surfbreak.swell.waves
+                 for band in (wave.band, wave.last_band) if len(band[1])]
+        if not bands:
+            return self.surface
+
+        cells = []
+        for band in bands:
+            x0, y0, y1 = band
+            top = y0.min()
+            self.dirty_rects.append(Rect(x0, top, len(y0), y1.max() - top))
+            cells.append(band_cells(band))
+
+        ys = np.concatenate([band_ys for band_ys, _ in cells])
+        xs = np.concatenate([band_xs for _, band_xs in cells])
+        # Bands run up the beach, where the color never changes
+        wet = self.surfbreak.base_water_level > self.surfbreak.sea_floor[ys, xs]
+        ys, xs = ys[wet], xs[wet]
+        pixels = surfarray.pixels3d(self.surface)
+        pixels[xs, ys] = map_to_rgb_array(self.surfbreak, ys, xs)
+        # Unlock the surface
+        del pixels
 
         return self.surface
 
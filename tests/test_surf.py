@@ -0,0 +1,91 @@
+import numpy as np
+import pytest
+from swell.envs.observation import SurfObservation
+from swell.envs.surf import SurfBreak, Swell
+from swell.envs.surfer import Surfer
+
+
+@pytest.mark.parametrize('swell_kwargs', [
+    # Short period, so consecutive bands overlap
+    dict(period=3, height=8, width=16, angle=2, speed=4),
+    dict(period=5, height=6, width=9, angle=-0.7, speed=-2.5),
+    dict(period=4, height=5, width=7, angle=0.45, speed=1.75),
+])
+def test_vectorized_matches_loop(swell_kwargs):
+    vectorized = SurfBreak(height=60, width=50,
+                           swell=Swell(**swell_kwargs))
+    loop = SurfBreak(height=60, width=50, swell=Swell(**swell_kwargs),
+                     vectorized=False)
+    for _ in range(80):
+        vectorized.step()
+        loop.step()
+        np.testing.assert_array_equal(vectorized.active_water_level,
+                                      loop.active_water_level)
+        np.testing.assert_array_equal(vectorized.crashing, loop.crashing)
+
+
+def test_crash_tables_stay_within_budget():
+    # Room for three tables of the widest wave
+    max_bytes = 3 * 9 * 60 * 50 * 8
+    vectorized = SurfBreak(height=60, width=50, crash_table_max_bytes=max_bytes,
+                           swell=Swell(period=3, width=9, speed=4))
+    loop = SurfBreak(height=60, width=50, vectorized=False,
+                     swell=Swell(period=3, width=9, speed=4))
+    for step in range(120):
+        for surfbreak in (vectorized, loop):
+            surfbreak.swell.height = 4 + step % 7
+            surfbreak.swell.width = 5 + step % 5
+            surfbreak.step()
+        np.testing.assert_array_equal(vectorized.crashing, loop.crashing)
+        tables = vectorized.crash_tables
+        assert vectorized.crash_tables_bytes == \
+            sum(table.nbytes for table in tables.values())
+        assert vectorized.crash_tables_bytes <= max_bytes
+        # Only the shapes of the waves just rasterized keep their tables
+        heights, widths = vectorized.frame_params[:2]
+        assert set(tables) <= set(zip(heights[0].tolist(),
+                                      widths[0].tolist()))
+
+
+def test_uint8_observation_round_trip():
+    surfbreak = SurfBreak(height=40, width=30, tide_init=2)
+    for _ in range(30):
+        surfbreak.step()
+    surfer = Surfer(surfbreak=surfbreak)
+    # Called before space, as TrajectoryDataset.regenerate does
+    obs = SurfObservation(dtype='uint8')(surfer)
+    ranges = SurfObservation().grid_ranges(surfbreak)
+    for key, grid in (('active_water_level', surfbreak.active_water_level),
+                      ('crashing', surfbreak.crashing)):
+        assert obs[key].dtype == np.uint8
+        low, high = ranges[key]
+        restored = low + obs[key] * ((high - low) / 255)
+        expected = np.clip(grid, low, high)
+        # Quantizing truncates, so values come back at most one step low
+        assert np.all(restored <= expected + 1e-9)
+        assert np.all(expected - restored < (high - low) / 255 + 1e-9)
+
+
+def test_step_n_frozen_does_not_move_the_break():
+    actions = dict(up=0, down=1, left=0, right=1, change_mode=1)
+    surfbreaks = [SurfBreak(height=60, width=50,
+                            swell=Swell(period=5, speed=-2, angle=0.5))
+                  for _ in range(2)]
+    for surfbreak in surfbreaks:
+        for _ in range(25):
+            surfbreak.step()
+    frozen = Surfer(surfbreak=surfbreaks[0], init_x=20, init_y=30)
+    stepped = Surfer(surfbreak=surfbreaks[1], init_x=20, init_y=30)
+
+    stoke = frozen.step_n_frozen(actions, 6)
+    # The same as six surfer steps with the break held still
+    stepped.step(actions)
+    for _ in range(5):
+        stepped.step(dict(actions, change_mode=0))
+    assert surfbreaks[0].swell.counter == surfbreaks[1].swell.counter == 25
+    assert (frozen.y, frozen.x, frozen.mode) == \
+        (stepped.y, stepped.x, stepped.mode)
+    np.testing.assert_array_equal(frozen.speed, stepped.speed)
+    assert stoke == stepped.total_stoke == frozen.total_stoke
+    with pytest.raises(ValueError):
+        frozen.step_n_frozen(actions, 0)